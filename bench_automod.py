@@ -0,0 +1,103 @@
+"""Microbenchmark: compiled automod matcher vs. the old per-word substring loop.
+
+Usage: python bench_automod.py [--terms 1500] [--messages 5000]
+
+Before timing, a fixed set of messages is checked against a small word list
+so evasion spellings keep matching and ids, prices and URLs keep not matching.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+os.environ.setdefault('DATABASE_PATH', ':memory:')
+
+import main
+
+
+CASE_WORDS = ["ass", "tit", "hell"]
+# (message, should match)
+CASES = [
+    ("what the h3ll", True),
+    ("you @ss", True),
+    ("a55hole", True),
+    ("HeLLLL no", True),
+    ("tіt", True),
+    ("hey <@714455123456789012>", False),
+    ("ping <@&455455455> and <#717171717171>", False),
+    ("nice <:pog:455455455455> <a:spin:717171>", False),
+    ("costs $455 total", False),
+    ("see https://cdn.discordapp.com/attachments/7171/455/a.png", False),
+    ("room 7171, floor 455", False),
+]
+
+
+def check_cases():
+    matcher = main.WordMatcher(CASE_WORDS)
+    failures = [(text, expected) for text, expected in CASES if bool(matcher.search(text)) != expected]
+    for text, expected in failures:
+        print(f"FAIL: {text!r} should {'match' if expected else 'not match'}")
+    print(f"cases          : {len(CASES) - len(failures)}/{len(CASES)} passed")
+    return not failures
+
+
+def make_terms(count, rng):
+    terms = set()
+    while len(terms) < count:
+        terms.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))))
+    return sorted(terms)
+
+
+def make_messages(count, terms, rng, hit_rate):
+    filler = ["hey", "anyone", "joining", "the", "session", "tonight", "lol", "what", "time", "is", "it", "ok", "thanks"]
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(filler) for _ in range(rng.randint(3, 25))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(terms).upper())
+        messages.append(" ".join(words))
+    return messages
+
+
+def time_per_message(check, messages):
+    hits = 0
+    start = time.perf_counter()
+    for text in messages:
+        if check(text):
+            hits += 1
+    elapsed = time.perf_counter() - start
+    return elapsed / len(messages) * 1e6, hits
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terms", type=int, default=1500)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--hit-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if not check_cases():
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    terms = make_terms(args.terms, rng)
+    messages = make_messages(args.messages, terms, rng, args.hit_rate)
+
+    start = time.perf_counter()
+    main.set_bad_words(terms)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    loop_us, loop_hits = time_per_message(lambda text: any(word in text.lower() for word in terms), messages)
+    matcher_us, matcher_hits = time_per_message(main.word_matcher.search, messages)
+
+    print(f"terms={len(terms)} messages={len(messages)} matcher build={build_ms:.1f} ms")
+    print(f"substring loop : {loop_us:8.2f} us/message  hits={loop_hits}")
+    print(f"compiled regex : {matcher_us:8.2f} us/message  hits={matcher_hits}")
+    print(f"speedup        : {loop_us / matcher_us:8.1f}x")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,182 @@
+"""Welcome-card benchmark: renders N cards from generated avatars in each render mode.
+
+Usage: python bench_images.py [--cards 100] [--modes inline,thread,process]
+
+Runs offline: avatars are derived from generated-icon.png and the banner is
+welcome_banner.png, or startup.png when the real banner isn't present. Each
+mode runs in a fresh subprocess so its peak RSS is its own. Every mode's
+output is compared byte-for-byte with the inline render as a regression check.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+os.environ.setdefault('DATABASE_PATH', ':memory:')
+
+from PIL import Image, ImageOps
+
+import main
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ICON_PATH = os.path.join(HERE, "generated-icon.png")
+FALLBACK_BANNER_PATH = os.path.join(HERE, "startup.png")
+
+
+def banner_path():
+    path = os.path.join(HERE, main.WELCOME_BANNER_PATH)
+    return path if os.path.exists(path) else FALLBACK_BANNER_PATH
+
+
+def make_avatars(count, seed):
+    """Distinct PNG avatars at Discord-like sizes: the icon resized, rotated, mirrored and recoloured."""
+    rng = random.Random(seed)
+    icon = Image.open(ICON_PATH).convert("RGB")
+    avatars = []
+    for _ in range(count):
+        size = rng.choice((128, 256, 512))
+        avatar = icon.resize((size, size)).rotate(rng.uniform(0, 360), fillcolor=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        if rng.random() < 0.5:
+            avatar = ImageOps.mirror(avatar)
+        avatar = ImageOps.colorize(ImageOps.grayscale(avatar), black=(rng.randrange(128), rng.randrange(128), rng.randrange(128)), white=(255, 255, 255))
+        output = BytesIO()
+        avatar.save(output, format="PNG")
+        avatars.append(output.getvalue())
+    return avatars
+
+
+def staged_render(avatar_bytes, timings):
+    """make_avatar_tile + render_card split into timed stages; must produce the same bytes as the real pair."""
+    template = main.card_template
+    size = main.AVATAR_SIZE
+
+    start = time.perf_counter()
+    avatar = Image.open(BytesIO(avatar_bytes))
+    avatar.load()
+    timings['decode'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    avatar = avatar.resize((size, size)).convert("RGBA")
+    timings['resize'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    circular_avatar = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    circular_avatar.paste(avatar, (0, 0))
+    circular_avatar.putalpha(template.mask)
+    timings['mask'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    avatar_with_outline = template.outline.copy()
+    avatar_with_outline.paste(circular_avatar, (5, 5), circular_avatar)
+    banner = template.banner.copy()
+    banner.paste(avatar_with_outline, template.position, avatar_with_outline)
+    timings['paste'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    output = BytesIO()
+    banner.save(output, format="PNG")
+    timings['encode'] += time.perf_counter() - start
+    return output.getvalue()
+
+
+def digest(cards):
+    return hashlib.sha256(b"".join(hashlib.sha256(card).digest() for card in cards)).hexdigest()
+
+
+async def render_all(renderer, avatars):
+    async def one(avatar_bytes):
+        tile = await renderer.run(main.make_avatar_tile, avatar_bytes)
+        return await renderer.run(main.render_card, tile)
+    return await asyncio.gather(*(one(avatar_bytes) for avatar_bytes in avatars))
+
+
+async def watch_loop(stop, worst):
+    """Longest gap between 10ms ticks, i.e. how long rendering kept the event loop busy."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(0.01)
+        worst[0] = max(worst[0], loop.time() - start - 0.01)
+
+
+async def run_mode(args):
+    path = banner_path()
+    avatars = make_avatars(args.cards, args.seed)
+    renderer = main.CardRenderer(path, args.mode)
+    if not renderer.available():
+        sys.exit(f"banner not found: {path}")
+
+    # One warm-up card so pool start-up and the banner decode aren't counted.
+    await render_all(renderer, avatars[:1])
+
+    stop = asyncio.Event()
+    worst = [0.0]
+    watcher = asyncio.create_task(watch_loop(stop, worst))
+    start = time.perf_counter()
+    cards = await render_all(renderer, avatars)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    renderer.close()
+
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.mode == "process":
+        peak_kib += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(f"{args.mode:8} {len(cards) / elapsed:8.1f} cards/s  {elapsed * 1000 / len(cards):7.2f} ms/card  "
+          f"peak RSS {peak_kib / 1024:7.1f} MiB  max loop stall {worst[0] * 1000:7.1f} ms  "
+          f"avg card {sum(map(len, cards)) / len(cards) / 1024:.0f} KiB  digest {digest(cards)[:16]}")
+
+
+def run_stages(args):
+    main.load_card_template(banner_path())
+    avatars = make_avatars(args.cards, args.seed)
+    timings = dict.fromkeys(("decode", "resize", "mask", "paste", "encode"), 0.0)
+    for avatar_bytes in avatars:
+        card = staged_render(avatar_bytes, timings)
+        if card != main.render_card(main.make_avatar_tile(avatar_bytes)):
+            sys.exit("staged render no longer matches make_avatar_tile + render_card; update staged_render")
+    total = sum(timings.values())
+    print("per-stage (inline, single card):")
+    for stage, seconds in timings.items():
+        print(f"  {stage:7} {seconds * 1000 / len(avatars):7.2f} ms  {seconds / total:6.1%}")
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=100)
+    parser.add_argument("--modes", default="inline,thread,process")
+    parser.add_argument("--workers", type=int, default=main.IMAGE_RENDER_WORKERS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        main.IMAGE_RENDER_WORKERS = args.workers
+        asyncio.run(run_mode(args))
+        return
+
+    print(f"cards={args.cards} workers={args.workers} banner={os.path.basename(banner_path())} cpus={os.cpu_count()}")
+    run_stages(args)
+    digests = set()
+    for mode in args.modes.split(","):
+        result = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--cards", str(args.cards), "--workers", str(args.workers), "--seed", str(args.seed)],
+            capture_output=True, text=True
+        )
+        lines = [line for line in result.stdout.splitlines() if line.startswith(mode)]
+        if result.returncode or not lines:
+            print(f"{mode:8} failed:\n{result.stderr}")
+            continue
+        print(lines[-1])
+        digests.add(lines[-1].rsplit("digest ", 1)[1])
+    print("outputs identical across modes" if len(digests) == 1 else "OUTPUTS DIFFER BETWEEN MODES")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,174 @@
+"""Offline message-flood benchmark: drives the real on_message handler with fake Discord objects.
+
+Usage: python bench_on_message.py [--messages 20000] [--users 500] [--channels 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import time
+import tracemalloc
+
+os.environ.setdefault('DATABASE_PATH', ':memory:')
+
+import main
+
+
+class FakeGuild:
+    id = 1
+
+    def get_member(self, user_id):
+        return None
+
+
+class FakeMember:
+    def __init__(self, user_id, guild):
+        self.id = user_id
+        self.bot = False
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.guild = guild
+        self.roles = []
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild, name):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+        self.category_id = None
+        self.sent = 0
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+
+class FakeMessage:
+    __slots__ = ('id', 'content', 'author', 'channel', 'guild', 'mentions', 'deleted')
+
+    def __init__(self, message_id, content, author, channel, mentions):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.mentions = mentions
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+
+def make_traffic(args, rng):
+    """Synthetic chat: many users, some mentions (a share of them AFK), some bad-word hits and ticket chatter."""
+    guild = FakeGuild()
+    members = [FakeMember(1000 + i, guild) for i in range(args.users)]
+    channels = [FakeChannel(10 + i, guild, "ticket-0001" if i == 0 else f"general-{i}") for i in range(args.channels)]
+    bad_words = sorted({''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 8))) for _ in range(args.bad_words)})
+    filler = ["hey", "anyone", "joining", "the", "session", "tonight", "lol", "what", "time", "is", "it", "ok", "thanks"]
+
+    messages = []
+    for message_id in range(args.messages):
+        words = [rng.choice(filler) for _ in range(rng.randint(3, 25))]
+        if rng.random() < args.bad_word_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(bad_words))
+        mentions = []
+        if rng.random() < args.mention_rate:
+            mentions = rng.sample(members, rng.randint(1, 3))
+            words.extend(member.mention for member in mentions)
+        messages.append(FakeMessage(message_id, " ".join(words), rng.choice(members), rng.choice(channels), mentions))
+
+    afk = {member.id: "brb" for member in rng.sample(members, max(1, len(members) // 20))}
+    return messages, channels, bad_words, afk
+
+
+async def process_commands(message):
+    pass
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_bench(args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    messages, channels, bad_words, afk = make_traffic(args, rng)
+
+    # No network: commands are a no-op, sends land on FakeChannel.send, and the outbound queue isn't paced.
+    main.process_commands = process_commands
+    main.outbox.rate = 10 ** 9
+    main.set_bad_words(bad_words)
+    main.user_afk.clear()
+    main.user_afk.update(afk)
+
+    on_message = main.on_message
+    for message in messages[:args.warmup]:
+        await on_message(message)
+    measured = messages[args.warmup:]
+
+    latencies = []
+    start = time.perf_counter()
+    for message in measured:
+        t0 = time.perf_counter()
+        await on_message(message)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    # Separate pass under tracemalloc: per-message allocation high-water mark and what stays allocated.
+    sample = measured[:args.alloc_messages]
+    per_message_peak = []
+    tracemalloc.start()
+    retained_before = tracemalloc.get_traced_memory()[0]
+    for message in sample:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await on_message(message)
+        per_message_peak.append(tracemalloc.get_traced_memory()[1] - base)
+    retained = tracemalloc.get_traced_memory()[0] - retained_before
+    tracemalloc.stop()
+
+    # Let queued sends and automod deletes finish so they're counted below.
+    while main.background_tasks:
+        await asyncio.gather(*list(main.background_tasks), return_exceptions=True)
+
+    latencies.sort()
+    count = len(measured)
+    print(f"messages={count} users={args.users} channels={args.channels} bad words={len(bad_words)}")
+    print(f"throughput     : {count / elapsed:10.0f} messages/s")
+    print(f"latency p50    : {percentile(latencies, 0.50) * 1e6:10.1f} us")
+    print(f"latency p99    : {percentile(latencies, 0.99) * 1e6:10.1f} us")
+    print(f"latency max    : {latencies[-1] * 1e6:10.1f} us")
+    per_message_peak.sort()
+    print(f"alloc/msg p50  : {percentile(per_message_peak, 0.50):10.0f} bytes  p99 {percentile(per_message_peak, 0.99):.0f} bytes")
+    print(f"retained/msg   : {retained / len(sample):10.1f} bytes  (over {len(sample)} messages)")
+    print(f"deleted={sum(message.deleted for message in measured)} sends={sum(channel.sent for channel in channels)}")
+    print("pipeline stages:")
+    for name, timer in main.message_pipeline.timers.items():
+        if timer.count:
+            print(f"  {name:22} avg {timer.total / timer.count * 1e6:8.1f} us  max {timer.max * 1e6:8.1f} us")
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--alloc-messages", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--bad-words", type=int, default=300)
+    parser.add_argument("--bad-word-rate", type=float, default=0.02)
+    parser.add_argument("--mention-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run_bench(args))
+
+
+if __name__ == "__main__":
+    main_bench()
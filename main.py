@@ -3,14 +3,29 @@ from discord.ext import commands
 from discord.ui import Button, View, Modal, TextInput
 from PIL import Image, ImageDraw, ImageFont
 import os
-from flask import Flask
-from threading import Thread
+from aiohttp import web
+from threading import Thread, Lock, get_ident
 from io import BytesIO
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
 import asyncio
 import random
 import json
 import re
+import sqlite3
+import unicodedata
+import gzip
+import tempfile
+import time
+import hashlib
+import math
+import sys
+import traceback
+import functools
+from bisect import bisect_left, insort
+from heapq import heappush, heappop, heapify
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlparse, parse_qs
 
 ANNOUNCEMENTS_CHANNEL_ID = 1429028560168816681
 TICKET_CATEGORY_ID = None
@@ -20,6 +35,7 @@ WELCOME_CHANNEL_ID = 1429040704486637599
 STAFF_ROLE_ID = 1429035155158208532
 TICKET_STAFF_ROLE_ID = 1429050967881416757
 BANNER_IMAGE_PATH = "GreenvilleSpringUpdateBanner(2025)(1).png"
+WELCOME_BANNER_PATH = "welcome_banner.png"
 
 WARNING_ROLE_1 = 1429197544499576903
 WARNING_ROLE_2 = 1429197737097822388
@@ -40,306 +56,1825 @@ REACTION_ROLE_MESSAGE_ID = 1429892266616553582
 REACTION_ROLE_EMOJI = "✅"
 REACTION_ROLE_ID = 1429032286623498240
 
+TICKET_INACTIVITY_SECONDS = 5 * 3600
+# Compressed transcripts larger than this spill from memory to a temporary file.
+TRANSCRIPT_SPOOL_BYTES = 4 * 1024 * 1024
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'greenville.db')
+FLUSH_INTERVAL_SECONDS = 5
+
+NAME_CACHE_SIZE = 2048
+NAME_CACHE_TTL_SECONDS = 3600
+
+# "thread" or "process" renders welcome cards in a worker pool; "inline" renders on the event loop.
+IMAGE_RENDER_MODE = os.environ.get('IMAGE_RENDER_MODE', 'thread')
+IMAGE_RENDER_WORKERS = 2
+AVATAR_SIZE = 200
+AVATAR_OUTLINE_SIZE = 210
+AVATAR_OUTLINE_COLOR = (88, 101, 242, 255)
+AVATAR_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# More than JOIN_BURST_THRESHOLD joins inside JOIN_BURST_WINDOW_SECONDS switches welcomes to batches.
+JOIN_BURST_THRESHOLD = 5
+JOIN_BURST_WINDOW_SECONDS = 10
+JOIN_BATCH_DELAY_SECONDS = 15
+JOIN_BATCH_MAX_MEMBERS = 50
+JOIN_COLLAGE_MAX_TILES = 25
+JOIN_COLLAGE_COLUMNS = 5
+
+SESSION_ASSET_FILES = ["startup.png", "early_release.png", "release.png", "session_end.png", "cohost.png", "giveaway.png"]
+# Private channel that hosts the session images; set this in production. With None the images are
+# attached to the first announcement and reused from there until that message is deleted.
+ASSET_CHANNEL_ID = None
+ASSET_URL_REFRESH_MARGIN_SECONDS = 3600
+
+# Ended giveaways whose entrants stay in memory so rerolls don't touch the database.
+ENDED_GIVEAWAYS_KEPT = 20
+# How long role changes for one member are collected before they go out as a single edit.
+ROLE_MUTATION_WINDOW_SECONDS = 0.5
+# Per-channel send budget for the outbound queue (Discord allows roughly 5 messages per 5s per channel).
+CHANNEL_SEND_RATE = 5
+CHANNEL_SEND_PER_SECONDS = 5
+# Queued log messages kept per channel before the oldest are dropped.
+OUTBOUND_LOG_BACKLOG = 200
+# How long staff-log events are buffered per channel before going out together (up to 10 embeds a message).
+LOG_BATCH_WINDOW_SECONDS = 3
+# Gap between batches of up to 10 queued reaction-role changes, to stay well inside the role-edit rate limit.
+REACTION_ROLE_INTERVAL_SECONDS = 0.25
+
+# The keep-alive / health / metrics HTTP server runs on the bot's own event loop.
+HEALTH_HOST = '0.0.0.0'
+HEALTH_PORT = int(os.environ.get('PORT', 5000))
+LOOP_LAG_INTERVAL_SECONDS = 1
+# The watchdog thread reports (with the loop thread's stack) when the loop stops turning for this long.
+SLOW_CALLBACK_SECONDS = 0.25
+WATCHDOG_INTERVAL_SECONDS = 0.05
+SLOW_REPORTS_KEPT = 10
+# A background job that crashes is logged and started again after this delay.
+JOB_RESTART_DELAY_SECONDS = 5
+
 TOKEN = os.environ.get('DISCORD_BOT_TOKEN') or os.environ.get('TOKEN')
 
+process_started_at = time.perf_counter()
+
 intents = discord.Intents.all()
 bot = commands.Bot(command_prefix='?', intents=intents)
 bot.remove_command('help')
 
 ticket_last_activity = {}
 ticket_warnings_sent = {}
+reaction_roles = {}
+active_applications = {}
+user_warnings = {}
+
+# ----- PROFILES -----
+class Profile:
+    """Leveling and economy state for one member. Cooldowns are epoch seconds, 0 meaning never."""
+    __slots__ = ('xp', 'level', 'wallet', 'bank', 'last_daily', 'last_work')
+
+    def __init__(self, xp=0, level=1, wallet=0, bank=0, last_daily=0, last_work=0):
+        self.xp = xp
+        self.level = level
+        self.wallet = wallet
+        self.bank = bank
+        self.last_daily = last_daily
+        self.last_work = last_work
+
+def get_profile(user_id):
+    profile = profiles.get(user_id)
+    if profile is None:
+        profile = profiles[user_id] = Profile()
+        level_index.mark(user_id)
+        wealth_index.mark(user_id)
+    return profile
+
+# ----- LEADERBOARD INDEX -----
+class RankingIndex:
+    """Profiles kept in leaderboard order, updated lazily.
+
+    Writers only mark a user dirty. Queries first re-slot the dirty users with
+    bisect, then read the top rows or a user's position straight off the list.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.entries = []
+        self.entry_for = {}
+        self.dirty = set()
+
+    def mark(self, user_id):
+        self.dirty.add(user_id)
+
+    def rebuild(self):
+        self.entry_for = {user_id: self.key(profile) + (user_id,) for user_id, profile in profiles.items()}
+        self.entries = sorted(self.entry_for.values())
+        self.dirty.clear()
+
+    def _sync(self):
+        for user_id in self.dirty:
+            old = self.entry_for.pop(user_id, None)
+            if old is not None:
+                del self.entries[bisect_left(self.entries, old)]
+            profile = profiles.get(user_id)
+            if profile is not None:
+                entry = self.key(profile) + (user_id,)
+                insort(self.entries, entry)
+                self.entry_for[user_id] = entry
+        self.dirty.clear()
+
+    def top(self, n):
+        """Return the best n (user_id, Profile) pairs."""
+        self._sync()
+        return [(entry[-1], profiles[entry[-1]]) for entry in self.entries[:n]]
+
+    def rank_of(self, user_id):
+        """Return the 1-based position of user_id, or None if they have no profile."""
+        self._sync()
+        entry = self.entry_for.get(user_id)
+        if entry is None:
+            return None
+        return bisect_left(self.entries, entry) + 1
+
+level_index = RankingIndex(lambda profile: (-profile.level, -profile.xp))
+wealth_index = RankingIndex(lambda profile: (-(profile.wallet + profile.bank),))
+
+# ----- NAME CACHE -----
+class NameCache:
+    """LRU + TTL cache of resolved user names for listings like the leaderboard."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return name
+
+    def put(self, user_id, name):
+        self.entries[user_id] = (name, time.monotonic() + self.ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def resolve(self, guild, user_ids):
+        """Return {user_id: name}, fetching whatever the caches can't answer concurrently."""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self.get(user_id)
+            if name is None:
+                user = (guild.get_member(user_id) if guild else None) or bot.get_user(user_id)
+                if user:
+                    name = user.name
+                    self.put(user_id, name)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+        
+        if missing:
+            results = await asyncio.gather(*(bot.fetch_user(user_id) for user_id in missing), return_exceptions=True)
+            for user_id, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    names[user_id] = f"Unknown User ({user_id})"
+                else:
+                    names[user_id] = result.name
+                    self.put(user_id, result.name)
+        return names
+
+name_cache = NameCache(NAME_CACHE_SIZE, NAME_CACHE_TTL_SECONDS)
+
+# ----- SCHEDULING -----
+class DeadlineScheduler:
+    """Fires an async callback for each key when its epoch-seconds deadline passes.
+
+    Deadlines live in a heap watched by a single task that sleeps until the
+    earliest one. Rescheduling a key pushes a fresh entry and the superseded one
+    is skipped when it surfaces, so schedule() and cancel() are O(log n).
+    """
+
+    def __init__(self, name, callback):
+        self.name = name
+        self.callback = callback
+        self.heap = []
+        self.deadlines = {}
+        self.wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        self.deadlines[key] = deadline
+        heappush(self.heap, (deadline, key))
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(deadline, key) for key, deadline in self.deadlines.items()]
+            heapify(self.heap)
+        if self.heap[0] == (deadline, key):
+            self.wakeup.set()
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def _next(self):
+        """Drop superseded entries and return the earliest live (deadline, key), or None."""
+        while self.heap:
+            deadline, key = self.heap[0]
+            if self.deadlines.get(key) == deadline:
+                return deadline, key
+            heappop(self.heap)
+        return None
+
+    async def run(self):
+        # Deadlines that passed while the bot was down fire immediately, so wait for the guild cache first.
+        await bot.wait_until_ready()
+        while not bot.is_closed():
+            entry = self._next()
+            delay = entry[0] - time.time() if entry else None
+            if delay is None or delay > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            heappop(self.heap)
+            del self.deadlines[entry[1]]
+            spawn(self._fire(entry[1]))
+
+    async def _fire(self, key):
+        try:
+            await self.callback(key)
+        except Exception as e:
+            print(f"Error in {self.name} callback for {key}: {e}")
+
+# ----- PERSISTENCE -----
+class WriteBehindStore:
+    """SQLite (WAL) backing for the member profiles.
+
+    Handlers only mark a user id dirty; a background task snapshots the dirty
+    rows on a timer and writes them in one transaction from a worker thread,
+    so the event loop never waits on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self.lock = Lock()
+        self.profiles = {}
+        self.dirty_levels = set()
+        self.dirty_economy = set()
+        self.entrant_changes = {}
+
+    def open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS user_levels (
+                user_id INTEGER PRIMARY KEY,
+                xp INTEGER NOT NULL,
+                level INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS user_economy (
+                user_id INTEGER PRIMARY KEY,
+                wallet INTEGER NOT NULL,
+                bank INTEGER NOT NULL,
+                last_daily INTEGER,
+                last_work INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS giveaways (
+                message_id INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                host INTEGER NOT NULL,
+                prize TEXT NOT NULL,
+                duration INTEGER NOT NULL,
+                end_time REAL NOT NULL,
+                winner_count INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE TABLE IF NOT EXISTS giveaway_entrants (
+                message_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (message_id, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS giveaway_winners (
+                message_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (message_id, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS view_state (
+                message_id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS reaction_roles (
+                message_id INTEGER NOT NULL,
+                emoji TEXT NOT NULL,
+                role_id INTEGER NOT NULL,
+                PRIMARY KEY (message_id, emoji)
+            );
+            """
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(giveaways)")]
+        if 'winner_count' not in columns:
+            self.conn.execute("ALTER TABLE giveaways ADD COLUMN winner_count INTEGER NOT NULL DEFAULT 1")
+        self.conn.commit()
+
+    def load(self):
+        """Open the database and return the user id -> Profile dict."""
+        self.open()
+        for user_id, xp, level in self.conn.execute("SELECT user_id, xp, level FROM user_levels"):
+            self.profiles[user_id] = Profile(xp=xp, level=level)
+        for user_id, wallet, bank, last_daily, last_work in self.conn.execute(
+            "SELECT user_id, wallet, bank, last_daily, last_work FROM user_economy"
+        ):
+            profile = self.profiles.get(user_id)
+            if profile is None:
+                profile = self.profiles[user_id] = Profile()
+            profile.wallet = wallet
+            profile.bank = bank
+            profile.last_daily = last_daily or 0
+            profile.last_work = last_work or 0
+        print(f"Loaded {len(self.profiles)} profiles from {self.path}")
+        return self.profiles
+
+    def load_giveaways(self):
+        giveaways = {}
+        for message_id, channel_id, host, prize, duration, end_time, winner_count in self.conn.execute(
+            "SELECT message_id, channel_id, host, prize, duration, end_time, winner_count FROM giveaways"
+        ):
+            giveaways[message_id] = {
+                'prize': prize,
+                'duration': duration,
+                'host': host,
+                'end_time': end_time,
+                'channel_id': channel_id,
+                'winner_count': winner_count
+            }
+        return giveaways
 
-app = Flask('')
+    def load_view_state(self):
+        return {
+            message_id: json.loads(data)
+            for message_id, data in self.conn.execute("SELECT message_id, data FROM view_state")
+        }
+
+    def load_settings(self):
+        return {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM settings")}
+
+    def load_reaction_roles(self):
+        return {
+            (message_id, emoji): role_id
+            for message_id, emoji, role_id in self.conn.execute("SELECT message_id, emoji, role_id FROM reaction_roles")
+        }
+
+    async def save_view_state(self, message_id, kind, data):
+        await self.execute(
+            "INSERT OR REPLACE INTO view_state (message_id, kind, data) VALUES (?, ?, ?)",
+            (message_id, kind, json.dumps(data))
+        )
+
+    async def delete_view_state(self, message_id):
+        await self.execute("DELETE FROM view_state WHERE message_id = ?", (message_id,))
+
+    async def save_setting(self, key, value):
+        await self.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    async def save_reaction_role(self, message_id, emoji, role_id):
+        await self.execute(
+            "INSERT OR REPLACE INTO reaction_roles (message_id, emoji, role_id) VALUES (?, ?, ?)",
+            (message_id, emoji, role_id)
+        )
 
-@app.route('/')
-def home():
-    return "Bot is alive!"
+    def _read_giveaway_users(self, table, message_id):
+        with self.lock:
+            return {row[0] for row in self.conn.execute(f"SELECT user_id FROM {table} WHERE message_id = ?", (message_id,))}
 
-def run():
-    app.run(host='0.0.0.0', port=5000)
+    async def read_giveaway_users(self, table, message_id):
+        """Return the user ids stored for one giveaway in giveaway_entrants or giveaway_winners."""
+        return await asyncio.to_thread(self._read_giveaway_users, table, message_id)
 
-Thread(target=run).start()
+    def mark_entrant(self, message_id, user_id, entered):
+        self.entrant_changes[(message_id, user_id)] = entered
 
-async def check_inactive_tickets():
-    await bot.wait_until_ready()
-    while not bot.is_closed():
+    def _execute(self, sql, params):
+        with self.lock, self.conn:
+            self.conn.execute(sql, params)
+
+    async def execute(self, sql, params=()):
+        """Run a single write immediately on a worker thread (for rare, must-not-lose changes)."""
+        await asyncio.to_thread(self._execute, sql, params)
+
+    async def save_giveaway(self, message_id, data):
+        await self.execute(
+            "INSERT OR REPLACE INTO giveaways (message_id, channel_id, host, prize, duration, end_time, winner_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (message_id, data['channel_id'], data['host'], data['prize'], data['duration'], data['end_time'], data['winner_count'])
+        )
+
+    async def save_giveaway_winners(self, message_id, user_ids):
+        def write():
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO giveaway_winners (message_id, user_id) VALUES (?, ?)",
+                    [(message_id, user_id) for user_id in user_ids]
+                )
+        await asyncio.to_thread(write)
+
+    async def delete_giveaway(self, message_id):
+        await self.execute("DELETE FROM giveaways WHERE message_id = ?", (message_id,))
+
+    def mark_levels(self, user_id):
+        self.dirty_levels.add(user_id)
+
+    def mark_economy(self, user_id):
+        self.dirty_economy.add(user_id)
+
+    def _snapshot(self):
+        """Copy the dirty rows out of the live profiles and reset the dirty sets."""
+        level_rows = []
+        for user_id in self.dirty_levels:
+            profile = self.profiles.get(user_id)
+            if profile:
+                level_rows.append((user_id, profile.xp, profile.level))
+        
+        economy_rows = []
+        for user_id in self.dirty_economy:
+            profile = self.profiles.get(user_id)
+            if profile:
+                economy_rows.append((user_id, profile.wallet, profile.bank, profile.last_daily, profile.last_work))
+        
+        entrant_changes = list(self.entrant_changes.items())
+        
+        self.dirty_levels = set()
+        self.dirty_economy = set()
+        self.entrant_changes = {}
+        return level_rows, economy_rows, entrant_changes
+
+    def _write(self, level_rows, economy_rows, entrant_changes):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO user_levels (user_id, xp, level) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET xp = excluded.xp, level = excluded.level",
+                level_rows
+            )
+            self.conn.executemany(
+                "INSERT INTO user_economy (user_id, wallet, bank, last_daily, last_work) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET wallet = excluded.wallet, bank = excluded.bank, "
+                "last_daily = excluded.last_daily, last_work = excluded.last_work",
+                economy_rows
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO giveaway_entrants (message_id, user_id) VALUES (?, ?)",
+                [key for key, entered in entrant_changes if entered]
+            )
+            self.conn.executemany(
+                "DELETE FROM giveaway_entrants WHERE message_id = ? AND user_id = ?",
+                [key for key, entered in entrant_changes if not entered]
+            )
+
+    async def flush(self):
+        if not self.dirty_levels and not self.dirty_economy and not self.entrant_changes:
+            return
+        
+        level_rows, economy_rows, entrant_changes = self._snapshot()
         try:
-            guild = bot.guilds[0]
-            ticket_category = bot.get_channel(TICKET_CATEGORY_ID)
-            
-            if ticket_category:
-                now = datetime.now(datetime.timezone.utc)
-                
-                for channel in ticket_category.channels:
-                    if channel.id in ticket_last_activity:
-                        last_activity = ticket_last_activity[channel.id]
-                        time_since_activity = now - last_activity
-                        
-                        if time_since_activity >= timedelta(hours=5):
-                            if channel.id not in ticket_warnings_sent:
-                                embed = discord.Embed(
-                                    title="⏰ Inactive Ticket",
-                                    description="This ticket has been inactive for 5 hours. Should it be closed?\n\nReact with ✅ to close this ticket.",
-                                    color=discord.Color.orange()
-                                )
-                                message = await channel.send(embed=embed)
-                                await message.add_reaction("✅")
-                                
-                                ticket_warnings_sent[channel.id] = now
+            await asyncio.to_thread(self._write, level_rows, economy_rows, entrant_changes)
         except Exception as e:
-            print(f"Error checking inactive tickets: {e}")
-        
-        await asyncio.sleep(3600)
+            print(f"Error flushing store: {e}")
+            self.dirty_levels.update(row[0] for row in level_rows)
+            self.dirty_economy.update(row[0] for row in economy_rows)
+            for key, entered in entrant_changes:
+                self.entrant_changes.setdefault(key, entered)
+
+    async def run(self):
+        while not bot.is_closed():
+            await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+            await self.flush()
+
+    def close(self):
+        """Write whatever is still pending and close the connection (called after bot.run returns)."""
+        if self.conn is None:
+            return
+        self._write(*self._snapshot())
+        self.conn.close()
+        self.conn = None
+
+store = WriteBehindStore(DATABASE_PATH)
+profiles = store.load()
+# State behind persistent buttons, keyed by the message they are attached to.
+view_state = store.load_view_state()
+settings = store.load_settings()
+# (message_id, emoji) -> role id; the configured verification role is always present.
+reaction_roles.update(store.load_reaction_roles())
+reaction_roles.setdefault((REACTION_ROLE_MESSAGE_ID, REACTION_ROLE_EMOJI), REACTION_ROLE_ID)
+
+async def remember_view(message, kind, **data):
+    view_state[message.id] = data
+    await store.save_view_state(message.id, kind, data)
+
+async def forget_view(message_id):
+    if view_state.pop(message_id, None) is not None:
+        await store.delete_view_state(message_id)
+
+async def update_setting(key, value):
+    settings[key] = value
+    await store.save_setting(key, value)
+level_index.rebuild()
+wealth_index.rebuild()
+
+# ----- HEALTH & METRICS -----
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
 
-@bot.event
-async def on_ready():
-    print(f'Logged in as {bot.user}')
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+class BotMetrics:
+    """Counters behind /metrics and ?perf: messages seen, per-command and per-event-handler latency."""
+
+    def __init__(self):
+        self.messages = 0
+        self.command_latency = {}
+        self.command_errors = {}
+        self.handler_latency = {}
+
+    def observe_handler(self, name, elapsed):
+        histogram = self.handler_latency.get(name)
+        if histogram is None:
+            histogram = self.handler_latency[name] = Histogram()
+        histogram.observe(elapsed)
+
+    def observe_command(self, name, elapsed, failed):
+        histogram = self.command_latency.get(name)
+        if histogram is None:
+            histogram = self.command_latency[name] = Histogram()
+        histogram.observe(elapsed)
+        if failed:
+            self.command_errors[name] = self.command_errors.get(name, 0) + 1
+
+bot_metrics = BotMetrics()
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. how long the event loop was kept busy."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.current = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=300)
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while not bot.is_closed():
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.current = max(0.0, loop.time() - start - self.interval)
+            self.max = max(self.max, self.current)
+            self.samples.append(self.current)
+
+loop_lag = LoopLagMonitor(LOOP_LAG_INTERVAL_SECONDS)
+
+class LoopWatchdog:
+    """A thread that notices when the event loop stops turning and snapshots what the loop thread is running.
+
+    The loop bumps a heartbeat every WATCHDOG_INTERVAL_SECONDS; if the heartbeat
+    goes stale past the threshold, the loop thread's stack is captured once per
+    stall and kept (with how long the stall lasted) for ?perf.
+    """
+
+    def __init__(self, threshold, interval, kept):
+        self.threshold = threshold
+        self.interval = interval
+        self.reports = deque(maxlen=kept)
+        self.stalls = 0
+        self.heartbeat = time.monotonic()
+        self.loop = None
+        self.loop_thread_id = None
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = get_ident()
+        self.beat()
+        self.thread = Thread(target=self.watch, name="loop watchdog", daemon=True)
+        self.thread.start()
+
+    def beat(self):
+        self.heartbeat = time.monotonic()
+        if not self.loop.is_closed():
+            self.loop.call_later(self.interval, self.beat)
+
+    def watch(self):
+        stalled = None
+        while not self.loop.is_closed():
+            time.sleep(self.interval)
+            blocked = time.monotonic() - self.heartbeat
+            if blocked < self.threshold:
+                if stalled is not None:
+                    stalled['seconds'] = stalled['blocked_until'] - stalled['since']
+                    print(f"Event loop was blocked for {stalled['seconds']:.2f}s:\n{stalled['stack']}")
+                    stalled = None
+                continue
+            
+            if stalled is None:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no frame)"
+                stalled = {'at': datetime.now(timezone.utc), 'since': self.heartbeat, 'stack': stack, 'seconds': blocked}
+                self.reports.append(stalled)
+                self.stalls += 1
+            stalled['blocked_until'] = time.monotonic()
+            stalled['seconds'] = blocked
+
+loop_watchdog = LoopWatchdog(SLOW_CALLBACK_SECONDS, WATCHDOG_INTERVAL_SECONDS, SLOW_REPORTS_KEPT)
+
+def timed_event(coro):
+    """bot.event, recording how long each call of the handler takes."""
+    @functools.wraps(coro)
+    async def handler(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await coro(*args, **kwargs)
+        finally:
+            bot_metrics.observe_handler(coro.__name__, time.perf_counter() - start)
+    return bot.event(handler)
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command(ctx):
+    # after_invoke runs whether or not the command raised.
+    started_at = getattr(ctx, 'started_at', None)
+    if started_at is not None:
+        bot_metrics.observe_command(ctx.command.qualified_name, time.perf_counter() - started_at, ctx.command_failed)
+
+def metrics_lines():
+    yield "# TYPE greenville_messages_total counter"
+    yield f"greenville_messages_total {bot_metrics.messages}"
+    
+    yield "# TYPE greenville_command_seconds histogram"
+    for name, histogram in sorted(bot_metrics.command_latency.items()):
+        yield from histogram.lines("greenville_command_seconds", f'command="{name}"')
+    yield "# TYPE greenville_command_errors_total counter"
+    for name, count in sorted(bot_metrics.command_errors.items()):
+        yield f'greenville_command_errors_total{{command="{name}"}} {count}'
+    
+    yield "# TYPE greenville_event_handler_seconds histogram"
+    for name, histogram in sorted(bot_metrics.handler_latency.items()):
+        yield from histogram.lines("greenville_event_handler_seconds", f'handler="{name}"')
+    
+    yield "# TYPE greenville_pipeline_stage_seconds summary"
+    for name, timer in message_pipeline.timers.items():
+        yield f'greenville_pipeline_stage_seconds_sum{{stage="{name}"}} {timer.total}'
+        yield f'greenville_pipeline_stage_seconds_count{{stage="{name}"}} {timer.count}'
+    
+    yield "# TYPE greenville_outbound_queue_depth gauge"
+    yield "# TYPE greenville_outbound_sent_total counter"
+    yield "# TYPE greenville_outbound_dropped_total counter"
+    for priority, name in enumerate(PRIORITY_NAMES):
+        yield f'greenville_outbound_queue_depth{{priority="{name}"}} {outbox.depth(priority)}'
+        yield f'greenville_outbound_sent_total{{priority="{name}"}} {outbox.sent[priority]}'
+        yield f'greenville_outbound_dropped_total{{priority="{name}"}} {outbox.dropped[priority]}'
+    yield "# TYPE greenville_outbound_throttled_total counter"
+    yield f"greenville_outbound_throttled_total {outbox.throttled}"
+    
+    yield "# TYPE greenville_queue_depth gauge"
+    yield f'greenville_queue_depth{{queue="reaction_roles"}} {len(reaction_role_queue.order)}'
+    yield f'greenville_queue_depth{{queue="role_mutations"}} {len(role_mutator.pending)}'
+    yield f'greenville_queue_depth{{queue="staff_log"}} {sum(len(events) for _, events in staff_log.buffers.values())}'
+    yield f'greenville_queue_depth{{queue="store_dirty"}} {len(store.dirty_levels) + len(store.dirty_economy) + len(store.entrant_changes)}'
+    yield f'greenville_queue_depth{{queue="background_tasks"}} {len(background_tasks)}'
+    yield "# TYPE greenville_role_calls_saved_total counter"
+    yield f"greenville_role_calls_saved_total {role_mutator.saved_calls}"
+    
+    yield "# TYPE greenville_avatar_cache_hits_total counter"
+    yield f"greenville_avatar_cache_hits_total {avatar_cache.hits}"
+    yield "# TYPE greenville_avatar_cache_misses_total counter"
+    yield f"greenville_avatar_cache_misses_total {avatar_cache.misses}"
+    yield "# TYPE greenville_avatar_cache_bytes gauge"
+    yield f"greenville_avatar_cache_bytes {avatar_cache.size}"
+    yield "# TYPE greenville_avatar_cache_entries gauge"
+    yield f"greenville_avatar_cache_entries {len(avatar_cache.entries)}"
+    
+    yield "# TYPE greenville_gateway_latency_seconds gauge"
+    yield f"greenville_gateway_latency_seconds {bot.latency if not math.isnan(bot.latency) else 'NaN'}"
+    yield "# TYPE greenville_loop_lag_seconds gauge"
+    yield f"greenville_loop_lag_seconds {loop_lag.current}"
+    yield "# TYPE greenville_loop_stalls_total counter"
+    yield f"greenville_loop_stalls_total {loop_watchdog.stalls}"
+    yield "# TYPE greenville_background_job_failures_total counter"
+    for name in sorted(background_jobs):
+        yield f'greenville_background_job_failures_total{{job="{name}"}} {job_failures.get(name, {}).get("count", 0)}'
+
+async def home(request):
+    return web.Response(text="Bot is alive!")
+
+async def healthz(request):
+    connected = not bot.is_closed() and bot.ws is not None and bot.ws.open
+    body = {
+        'connected': connected,
+        'latency': None if math.isnan(bot.latency) else round(bot.latency, 4),
+        'loop_lag': round(loop_lag.current, 4),
+        'loop_lag_max': round(loop_lag.max, 4),
+        'jobs': {},
+    }
+    for name, task in background_jobs.items():
+        failure = job_failures.get(name, {})
+        body['jobs'][name] = {'running': not task.done(), 'failures': failure.get('count', 0), 'last_error': failure.get('last_error')}
+    return web.json_response(body, status=200 if connected else 503)
+
+async def metrics(request):
+    return web.Response(text="\n".join(metrics_lines()) + "\n", content_type="text/plain", charset="utf-8")
+
+health_app = web.Application()
+health_app.router.add_get('/', home)
+health_app.router.add_get('/healthz', healthz)
+health_app.router.add_get('/metrics', metrics)
+
+async def serve_health():
+    runner = web.AppRunner(health_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, HEALTH_HOST, HEALTH_PORT).start()
+    print(f"Health server listening on port {HEALTH_PORT}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+# ----- TICKET INACTIVITY -----
+def is_ticket_channel(channel):
+    if channel.id in ticket_last_activity:
+        return True
+    if TICKET_CATEGORY_ID is not None and getattr(channel, 'category_id', None) == TICKET_CATEGORY_ID:
+        return True
+    return getattr(channel, 'name', '').startswith("ticket-")
+
+def touch_ticket(channel_id, at=None):
+    """Record activity in a ticket (now, or at the given time) and push its inactivity warning back."""
+    at = at or datetime.now(timezone.utc)
+    ticket_last_activity[channel_id] = at
+    ticket_warnings_sent.pop(channel_id, None)
+    ticket_timers.schedule(channel_id, at.timestamp() + TICKET_INACTIVITY_SECONDS)
+
+def seed_ticket_timers():
+    """Schedule the open tickets after a restart, counting inactivity from each channel's last message.
+
+    Deadlines only live in memory, so without this a quiet ticket would never
+    be warned about until someone posted in it again.
+    """
+    for guild in bot.guilds:
+        for channel in guild.text_channels:
+            if channel.id in ticket_last_activity or not is_ticket_channel(channel):
+                continue
+            last_message_id = channel.last_message_id
+            touch_ticket(channel.id, discord.utils.snowflake_time(last_message_id) if last_message_id else channel.created_at)
+
+def forget_ticket(channel_id):
+    ticket_last_activity.pop(channel_id, None)
+    ticket_warnings_sent.pop(channel_id, None)
+    ticket_timers.cancel(channel_id)
+
+async def warn_inactive_ticket(channel_id):
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        forget_ticket(channel_id)
+        return
+    if channel_id in ticket_warnings_sent:
+        return
     
+    embed = discord.Embed(
+        title="⏰ Inactive Ticket",
+        description="This ticket has been inactive for 5 hours. Should it be closed?\n\nReact with ✅ to close this ticket.",
+        color=discord.Color.orange()
+    )
+    message = await channel.send(embed=embed)
+    await message.add_reaction("✅")
+    
+    ticket_warnings_sent[channel_id] = datetime.now(timezone.utc)
+
+ticket_timers = DeadlineScheduler("ticket inactivity", warn_inactive_ticket)
+
+# ----- TICKET TRANSCRIPTS -----
+def transcript_lines(message):
+    yield f"[{message.created_at:%Y-%m-%d %H:%M:%S} UTC] {message.author} ({message.author.id}): {message.content}"
+    for attachment in message.attachments:
+        yield f"    [attachment] {attachment.filename} ({attachment.size} bytes) {attachment.url}"
+    for embed in message.embeds:
+        parts = [part for part in (embed.title, embed.description) if part]
+        parts.extend(f"{field.name}: {field.value}" for field in embed.fields)
+        yield "    [embed] " + " | ".join(parts).replace("\n", " ")
+
+async def export_transcript(channel):
+    """Stream a channel's whole history, oldest first, into a gzip'd text file.
+
+    Pages are compressed as they arrive and the output spills to disk past
+    TRANSCRIPT_SPOOL_BYTES, so memory stays flat however long the ticket is.
+    Returns (discord.File, message_count); the caller closes the file's fp
+    once it has been sent.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=TRANSCRIPT_SPOOL_BYTES)
+    count = 0
+    try:
+        with gzip.GzipFile(fileobj=spool, mode="wb") as transcript:
+            transcript.write(f"Transcript of #{channel.name} ({channel.id})\n\n".encode())
+            async for message in channel.history(limit=None, oldest_first=True):
+                transcript.write(("\n".join(transcript_lines(message)) + "\n").encode())
+                count += 1
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return discord.File(spool, filename=f"{channel.name}-transcript.txt.gz"), count
+
+async def log_ticket_transcript(channel, closed_by, reason):
+    """Post a closing ticket's full transcript to STAFF_LOG_CHANNEL_ID."""
+    if not STAFF_LOG_CHANNEL_ID:
+        return
+    log_channel = channel.guild.get_channel(STAFF_LOG_CHANNEL_ID)
+    try:
+        transcript, count = await export_transcript(channel)
+        try:
+            await outbox.send(
+                log_channel,
+                f"Ticket {channel.name} closed by {closed_by}.\nReason: {reason}\nTranscript: {count} messages attached.",
+                file=transcript,
+                priority=PRIORITY_LOG
+            )
+        finally:
+            # discord.File doesn't close file objects it was handed, so drop the spool (and its temp file) here.
+            transcript.close()
+            transcript.fp.close()
+    except Exception as e:
+        print(f"Error exporting transcript for {channel.name}: {e}")
+
+# ----- STARTUP -----
+background_jobs = {}
+job_failures = {}
+startup_complete = False
+
+def start_background_job(name, coro_func):
+    """Start coro_func() as the named long-running job unless that job is already running.
+
+    The jobs are meant to run forever, so one that raises (or returns) is
+    logged, counted in job_failures for /healthz and /metrics, and started
+    again after JOB_RESTART_DELAY_SECONDS.
+    """
+    task = background_jobs.get(name)
+    if task is None or task.done():
+        task = background_jobs[name] = asyncio.create_task(coro_func(), name=name)
+        task.add_done_callback(functools.partial(background_job_done, name, coro_func))
+    return task
+
+def background_job_done(name, coro_func, task):
+    if task.cancelled() or bot.is_closed():
+        return
+    error = task.exception()
+    failure = job_failures.setdefault(name, {'count': 0, 'last_error': None})
+    failure['count'] += 1
+    if error is None:
+        failure['last_error'] = "exited"
+        print(f"Background job '{name}' exited, restarting in {JOB_RESTART_DELAY_SECONDS}s")
+    else:
+        failure['last_error'] = f"{error.__class__.__name__}: {error}"
+        print(f"Background job '{name}' crashed, restarting in {JOB_RESTART_DELAY_SECONDS}s:")
+        traceback.print_exception(error)
+    asyncio.get_running_loop().call_later(JOB_RESTART_DELAY_SECONDS, start_background_job, name, coro_func)
+
+def command_tree_hash():
+    payload = []
+    for command_type in (discord.AppCommandType.chat_input, discord.AppCommandType.user, discord.AppCommandType.message):
+        payload.extend(command.to_dict(bot.tree) for command in bot.tree.get_commands(type=command_type))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def sync_command_tree():
+    """Sync slash commands only when the tree differs from the last successful sync."""
+    tree_hash = command_tree_hash()
+    if settings.get('command_tree_hash') == tree_hash:
+        print("Slash commands unchanged since last sync, skipping")
+        return
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} slash commands")
+        await update_setting('command_tree_hash', tree_hash)
     except Exception as e:
         print(f"Failed to sync slash commands: {e}")
+
+@timed_event
+async def setup_hook():
+    start_background_job("store flush", store.run)
+    start_background_job("ticket timers", ticket_timers.run)
+    start_background_job("giveaway timers", giveaway_timers.run)
+    start_background_job("reaction roles", reaction_role_queue.run)
+    start_background_job("loop lag", loop_lag.run)
+    loop_watchdog.start()
+    start_background_job("health server", serve_health)
     
-    bot.loop.create_task(check_inactive_tickets())
+    bot.add_view(TicketPanelView())
+    bot.add_view(TicketCloseView())
+    bot.add_view(ApplicationReviewView())
+    bot.add_view(SessionLinkView())
     
-    channel = bot.get_channel(TICKET_CHANNEL_ID)
-    if channel:
-        async for message in channel.history(limit=50):
-            if message.author == bot.user and message.embeds:
-                for embed in message.embeds:
-                    if embed.title == "Create a Ticket":
-                        await message.delete()
-                        print(f"Deleted old ticket button")
+    await sync_command_tree()
+
+@timed_event
+async def on_ready():
+    # on_ready fires again after every gateway reconnect; the startup work below runs once per process.
+    global startup_complete
+    if startup_complete:
+        print(f'Reconnected as {bot.user}')
+        return
+    startup_complete = True
+    print(f'Logged in as {bot.user}')
+    
+    seed_ticket_timers()
+    
+    # The buttons themselves are persistent views registered in setup_hook, so the
+    # panel only needs posting the very first time (replacing any pre-persistent panel).
+    if 'ticket_panel_message_id' not in settings:
+        channel = bot.get_channel(TICKET_CHANNEL_ID)
+        if channel:
+            async for message in channel.history(limit=50):
+                if message.author == bot.user and any(embed.title == "Create a Ticket" for embed in message.embeds):
+                    await message.delete()
+            message = await channel.send(embed=ticket_panel_embed(), view=TicketPanelView())
+            await update_setting('ticket_panel_message_id', message.id)
+            print(f"Ticket button sent to channel {TICKET_CHANNEL_ID}")
+    
+    if ASSET_CHANNEL_ID is None or bot.get_channel(ASSET_CHANNEL_ID) is None:
+        print("ASSET_CHANNEL_ID is not set up; session images are re-attached whenever their last announcement is deleted")
+    
+    for message_id, data in list(active_giveaways.items()):
+        channel = bot.get_channel(data['channel_id'])
+        if channel is not None:
+            giveaway_entries.reconcile(channel, message_id)
+    
+    print(f"Ready in {time.perf_counter() - process_started_at:.2f}s")
+
+# ----- WELCOME CARDS -----
+class CardTemplate:
+    """The decoded welcome banner with the avatar mask and outline ring drawn once."""
+
+    def __init__(self, path):
+        self.banner = Image.open(path).convert("RGBA")
         
-        embed = discord.Embed(
-            title="Create a Ticket",
-            description="Press the button below to create a ticket.",
-            color=discord.Color.orange()
+        self.mask = Image.new('L', (AVATAR_SIZE, AVATAR_SIZE), 0)
+        ImageDraw.Draw(self.mask).ellipse([0, 0, AVATAR_SIZE, AVATAR_SIZE], fill=255)
+        
+        self.outline = Image.new('RGBA', (AVATAR_OUTLINE_SIZE, AVATAR_OUTLINE_SIZE), (0, 0, 0, 0))
+        ImageDraw.Draw(self.outline).ellipse(
+            [0, 0, AVATAR_OUTLINE_SIZE - 1, AVATAR_OUTLINE_SIZE - 1], fill=AVATAR_OUTLINE_COLOR
+        )
+        
+        self.position = (
+            (self.banner.width - AVATAR_OUTLINE_SIZE) // 2,
+            (self.banner.height - AVATAR_OUTLINE_SIZE) // 2
         )
-        button = Button(label="Create Ticket", style=discord.ButtonStyle.green)
-
-        async def button_callback(interaction):
-            modal = Modal(title="Ticket Reason")
-            reason_input = TextInput(label="Reason", placeholder="Why are you opening this ticket?")
-            modal.add_item(reason_input)
-
-            async def modal_callback(modal_interaction):
-                guild = interaction.guild
-                category = guild.get_channel(TICKET_CATEGORY_ID)
-                
-                # Create ticket channel with permissions
-                ticket_channel = await guild.create_text_channel(
-                    name=f"ticket-{interaction.user.name}",
-                    category=category,
-                    overwrites={
-                        guild.default_role: discord.PermissionOverwrite(view_channel=False),
-                        interaction.user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-                        guild.get_role(TICKET_STAFF_ROLE_ID): discord.PermissionOverwrite(view_channel=True, send_messages=True)
-                    }
-                )
-                
-                ticket_last_activity[ticket_channel.id] = datetime.now(datetime.timezone.utc)
-                
-                await ticket_channel.send(
-                    f"<@&{STAFF_ROLE_ID}> {interaction.user.mention} created a ticket!\nReason: {reason_input.value}"
-                )
-                
-                if STAFF_LOG_CHANNEL_ID:
-                    log_channel = guild.get_channel(STAFF_LOG_CHANNEL_ID)
-                    await log_channel.send(f"Ticket created by {interaction.user} in {ticket_channel.mention}")
-                
-                await modal_interaction.response.send_message(f"Ticket created: {ticket_channel.mention}", ephemeral=True)
-
-            modal.on_submit = modal_callback
-            await interaction.response.send_modal(modal)
 
-        button.callback = button_callback
-        view = View(timeout=None)
-        view.add_item(button)
-        await channel.send(embed=embed, view=view)
-        print(f"Ticket button sent to channel {TICKET_CHANNEL_ID}")
+card_template = None
+
+def load_card_template(path):
+    """Decode the banner into this process (also the process pool initializer)."""
+    global card_template
+    card_template = CardTemplate(path)
+
+def make_avatar_tile(avatar_bytes):
+    """Decode an avatar into a circular AVATAR_SIZE tile. Meant to run off the event loop."""
+    avatar = Image.open(BytesIO(avatar_bytes)).resize((AVATAR_SIZE, AVATAR_SIZE)).convert("RGBA")
+    
+    circular_avatar = Image.new('RGBA', (AVATAR_SIZE, AVATAR_SIZE), (0, 0, 0, 0))
+    circular_avatar.paste(avatar, (0, 0))
+    circular_avatar.putalpha(card_template.mask)
+    return circular_avatar
+
+def render_card(circular_avatar):
+    """Composite an avatar tile onto the welcome banner and return PNG bytes. Meant to run off the event loop."""
+    template = card_template
+    avatar_with_outline = template.outline.copy()
+    avatar_with_outline.paste(circular_avatar, (5, 5), circular_avatar)
+    
+    banner = template.banner.copy()
+    banner.paste(avatar_with_outline, template.position, avatar_with_outline)
+    
+    output = BytesIO()
+    banner.save(output, format="PNG")
+    return output.getvalue()
+
+def render_collage(circular_avatars):
+    """Lay avatar tiles out in an outlined grid and return PNG bytes. Meant to run off the event loop."""
+    template = card_template
+    cell = AVATAR_OUTLINE_SIZE + 20
+    columns = min(len(circular_avatars), JOIN_COLLAGE_COLUMNS)
+    rows = (len(circular_avatars) + columns - 1) // columns
+    collage = Image.new('RGBA', (columns * cell, rows * cell), (0, 0, 0, 0))
+    
+    for i, circular_avatar in enumerate(circular_avatars):
+        avatar_with_outline = template.outline.copy()
+        avatar_with_outline.paste(circular_avatar, (5, 5), circular_avatar)
+        position = ((i % columns) * cell + 10, (i // columns) * cell + 10)
+        collage.paste(avatar_with_outline, position, avatar_with_outline)
+    
+    output = BytesIO()
+    collage.save(output, format="PNG")
+    return output.getvalue()
+
+class AvatarTileCache:
+    """Byte-capped LRU of circular avatar tiles keyed by avatar asset hash."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        tile = self.entries.get(key)
+        if tile is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return tile
+
+    def put(self, key, tile):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old.getbands()) * old.width * old.height
+        self.entries[key] = tile
+        self.size += len(tile.getbands()) * tile.width * tile.height
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            key, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.getbands()) * evicted.width * evicted.height
+
+avatar_cache = AvatarTileCache(AVATAR_CACHE_MAX_BYTES)
+
+class CardRenderer:
+    """Renders welcome/goodbye cards in a thread or process pool, loading the banner on first use."""
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.ready = False
+        self.executor = None
+
+    def _start(self):
+        if not os.path.exists(self.path):
+            return False
+        if self.mode == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=IMAGE_RENDER_WORKERS, initializer=load_card_template, initargs=(self.path,)
+            )
+        else:
+            load_card_template(self.path)
+            if self.mode == "thread":
+                self.executor = ThreadPoolExecutor(max_workers=IMAGE_RENDER_WORKERS, thread_name_prefix="card")
+        self.ready = True
+        return True
+
+    def available(self):
+        return self.ready or self._start()
+
+    async def run(self, func, *args):
+        if self.executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def avatar_tile(self, asset):
+        """Return the circular tile for a discord.Asset, downloading and decoding it only on a cache miss."""
+        tile = avatar_cache.get(asset.key)
+        if tile is None:
+            tile = await self.run(make_avatar_tile, await asset.read())
+            avatar_cache.put(asset.key, tile)
+        return tile
+
+    async def render(self, asset):
+        """Return the card for an avatar asset as PNG bytes, or None when there is no banner to draw on."""
+        if not self.available():
+            return None
+        return await self.run(render_card, await self.avatar_tile(asset))
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+card_renderer = CardRenderer(WELCOME_BANNER_PATH, IMAGE_RENDER_MODE)
+
+async def member_card_file(member, filename):
+    """Render member's card and wrap it as an attachment, or return None if there is no banner."""
+    card = await card_renderer.render(member.display_avatar)
+    if card is None:
+        return None
+    return discord.File(BytesIO(card), filename=filename)
+
+class JoinCoalescer:
+    """Batches welcomes during join bursts.
+
+    Below the burst rate every member gets their own card as before. Once the
+    rate is exceeded, joiners are held for JOIN_BATCH_DELAY_SECONDS and then
+    welcomed together in one message with a collage of their avatars.
+    """
+
+    def __init__(self):
+        self.recent = deque()
+        self.pending = []
+        self.flush_task = None
+
+    def add(self, member):
+        """Record a join; return True if the member was buffered for a batch welcome."""
+        now = time.monotonic()
+        self.recent.append(now)
+        while self.recent and now - self.recent[0] > JOIN_BURST_WINDOW_SECONDS:
+            self.recent.popleft()
+        
+        if self.flush_task is None and len(self.recent) <= JOIN_BURST_THRESHOLD:
+            return False
+        
+        self.pending.append(member)
+        if self.flush_task is None:
+            self.flush_task = spawn(self.flush_later())
+        return True
 
-    
-    reaction_role_channel = bot.get_channel(REACTION_ROLE_CHANNEL_ID)
-    if reaction_role_channel:
+    async def flush_later(self):
         try:
-            old_message = await reaction_role_channel.fetch_message(REACTION_ROLE_MESSAGE_ID)
-            embed = old_message.embeds[0] if old_message.embeds else None
-            content = old_message.content
-            
-            await old_message.delete()
-            print(f"Deleted old reaction role message {REACTION_ROLE_MESSAGE_ID}")
-            
-            if embed:
-                new_message = await reaction_role_channel.send(content=content, embed=embed)
-            else:
-                new_message = await reaction_role_channel.send(content=content)
-            
-            await new_message.add_reaction(REACTION_ROLE_EMOJI)
-            reaction_roles[(new_message.id, REACTION_ROLE_EMOJI)] = REACTION_ROLE_ID
-            print(f"Resent reaction role message with ID {new_message.id} and added reaction role")
-        except discord.NotFound:
-            print(f"Reaction role message {REACTION_ROLE_MESSAGE_ID} not found")
-        except Exception as e:
-            print(f"Error resending reaction role message: {e}")
+            await asyncio.sleep(JOIN_BATCH_DELAY_SECONDS)
+        finally:
+            self.flush_task = None
+        members, self.pending = self.pending, []
+        for i in range(0, len(members), JOIN_BATCH_MAX_MEMBERS):
+            try:
+                await self.send_batch(members[i:i + JOIN_BATCH_MAX_MEMBERS])
+            except Exception as e:
+                print(f"Error in batched welcome message: {e}")
+
+    async def send_batch(self, members):
+        channel = bot.get_channel(WELCOME_CHANNEL_ID)
+        embed = discord.Embed(
+            title=f"Thank you for joining Greenville Roleplay Prism, all {len(members)} of you!",
+            description=" ".join(member.mention for member in members),
+            color=discord.Color.orange()
+        )
+        
+        if card_renderer.available():
+            tiles = []
+            for member in members[:JOIN_COLLAGE_MAX_TILES]:
+                try:
+                    tiles.append(await card_renderer.avatar_tile(member.display_avatar))
+                except Exception as e:
+                    print(f"Error loading avatar for {member}: {e}")
+            if tiles:
+                collage = await card_renderer.run(render_collage, tiles)
+                embed.set_image(url="attachment://welcome_batch.png")
+                await channel.send(embed=embed, file=discord.File(BytesIO(collage), filename="welcome_batch.png"))
+                return
+        
+        await channel.send(embed=embed)
 
-@bot.event
+join_coalescer = JoinCoalescer()
+
+@timed_event
 async def on_member_join(member):
     if member.bot:
         return
+    if join_coalescer.add(member):
+        return
     channel = bot.get_channel(WELCOME_CHANNEL_ID)
     try:
-        if os.path.exists("welcome_banner.png"):
-            banner = Image.open("welcome_banner.png").convert("RGBA")
-            avatar_bytes = await member.display_avatar.read()
-            avatar_io = BytesIO(avatar_bytes)
-            avatar = Image.open(avatar_io).resize((200, 200)).convert("RGBA")
-            
-            mask = Image.new('L', (200, 200), 0)
-            mask_draw = ImageDraw.Draw(mask)
-            mask_draw.ellipse([0, 0, 200, 200], fill=255)
-            
-            circular_avatar = Image.new('RGBA', (200, 200), (0, 0, 0, 0))
-            circular_avatar.paste(avatar, (0, 0))
-            circular_avatar.putalpha(mask)
-            
-            outline_size = 210
-            avatar_with_outline = Image.new('RGBA', (outline_size, outline_size), (0, 0, 0, 0))
-            outline_draw = ImageDraw.Draw(avatar_with_outline)
-            outline_draw.ellipse([0, 0, outline_size-1, outline_size-1], fill=(88, 101, 242, 255))
-            avatar_with_outline.paste(circular_avatar, (5, 5), circular_avatar)
-            
-            position = ((banner.width - outline_size) // 2, (banner.height - outline_size) // 2)
-            banner.paste(avatar_with_outline, position, avatar_with_outline)
-            banner.save("welcome_final.png")
-            
-            file = discord.File("welcome_final.png")
-            embed = discord.Embed(
-                title="Thank you for joining Greenville Roleplay Prism",
-                description=f"{member.mention}",
-                color=discord.Color.orange()
-            )
+        embed = discord.Embed(
+            title="Thank you for joining Greenville Roleplay Prism",
+            description=f"{member.mention}",
+            color=discord.Color.orange()
+        )
+        file = await member_card_file(member, "welcome_final.png")
+        if file:
             embed.set_image(url="attachment://welcome_final.png")
             await channel.send(embed=embed, file=file)
         else:
-            embed = discord.Embed(
-                title="Thank you for joining Greenville Roleplay Prism",
-                description=f"{member.mention}",
-                color=discord.Color.orange()
-            )
             await channel.send(embed=embed)
     except Exception as e:
         print(f"Error in welcome message: {e}")
 
-@bot.event
+@timed_event
 async def on_member_remove(member):
     if member.bot:
         return
     channel = bot.get_channel(WELCOME_CHANNEL_ID)
     try:
-        if os.path.exists("welcome_banner.png"):
-            banner = Image.open("welcome_banner.png").convert("RGBA")
-            avatar_bytes = await member.display_avatar.read()
-            avatar_io = BytesIO(avatar_bytes)
-            avatar = Image.open(avatar_io).resize((200, 200)).convert("RGBA")
-            
-            mask = Image.new('L', (200, 200), 0)
-            mask_draw = ImageDraw.Draw(mask)
-            mask_draw.ellipse([0, 0, 200, 200], fill=255)
-            
-            circular_avatar = Image.new('RGBA', (200, 200), (0, 0, 0, 0))
-            circular_avatar.paste(avatar, (0, 0))
-            circular_avatar.putalpha(mask)
-            
-            outline_size = 210
-            avatar_with_outline = Image.new('RGBA', (outline_size, outline_size), (0, 0, 0, 0))
-            outline_draw = ImageDraw.Draw(avatar_with_outline)
-            outline_draw.ellipse([0, 0, outline_size-1, outline_size-1], fill=(88, 101, 242, 255))
-            avatar_with_outline.paste(circular_avatar, (5, 5), circular_avatar)
-            
-            position = ((banner.width - outline_size) // 2, (banner.height - outline_size) // 2)
-            banner.paste(avatar_with_outline, position, avatar_with_outline)
-            banner.save("goodbye_final.png")
-            
-            file = discord.File("goodbye_final.png")
-            embed = discord.Embed(
-                title="We hope you had a great time in Greenville Roleplay Prism!",
-                description=f"{member.name} has left the server",
-                color=discord.Color.orange()
-            )
+        embed = discord.Embed(
+            title="We hope you had a great time in Greenville Roleplay Prism!",
+            description=f"{member.name} has left the server",
+            color=discord.Color.orange()
+        )
+        file = await member_card_file(member, "goodbye_final.png")
+        if file:
             embed.set_image(url="attachment://goodbye_final.png")
             await channel.send(embed=embed, file=file)
         else:
-            embed = discord.Embed(
-                title="We hope you had a great time in Greenville Roleplay Prism!",
-                description=f"{member.name} has left the server",
-                color=discord.Color.orange()
-            )
             await channel.send(embed=embed)
     except Exception as e:
         print(f"Error in leave message: {e}")
 
+# ----- SESSION ASSETS -----
+class SessionAssets:
+    """Session images kept in memory, uploaded once and then reused by CDN URL.
+
+    The first send uploads the file (to ASSET_CHANNEL_ID, or attached to the
+    announcement itself) and remembers the URL Discord returns. Discord doesn't
+    check embed image URLs at send time, so a dead URL would just show a broken
+    image; the URL is therefore dropped when it nears the expiry signed into it
+    or when the message hosting the file is deleted, and the next send uploads
+    the file again.
+    """
+
+    def __init__(self, names):
+        self.data = {}
+        self.urls = {}
+        # id of the message hosting each remembered URL -> image name
+        self.sources = {}
+        for name in names:
+            if os.path.exists(name):
+                with open(name, "rb") as f:
+                    self.data[name] = f.read()
+
+    def __contains__(self, name):
+        return name in self.data
+
+    def fresh_url(self, name):
+        url = self.urls.get(name)
+        if url is None:
+            return None
+        expires = parse_qs(urlparse(url).query).get("ex")
+        if expires and int(expires[0], 16) - ASSET_URL_REFRESH_MARGIN_SECONDS < time.time():
+            del self.urls[name]
+            return None
+        return url
+
+    def remember(self, name, message, url):
+        for message_id, source in list(self.sources.items()):
+            if source == name:
+                del self.sources[message_id]
+        self.urls[name] = url
+        self.sources[message.id] = name
+
+    def forget_message(self, message_id):
+        """Drop the URL hosted by a deleted message so the next send uploads the file again."""
+        name = self.sources.pop(message_id, None)
+        if name is not None:
+            self.urls.pop(name, None)
+
+    async def upload(self, name):
+        """Host the file in ASSET_CHANNEL_ID and return its URL, or None if there is no asset channel."""
+        channel = bot.get_channel(ASSET_CHANNEL_ID) if ASSET_CHANNEL_ID else None
+        if channel is None:
+            return None
+        message = await channel.send(file=discord.File(BytesIO(self.data[name]), filename=name))
+        self.remember(name, message, message.attachments[0].url)
+        return self.urls[name]
+
+    async def send(self, send, name, embed, **kwargs):
+        """Call send (e.g. channel.send or message.reply) with name as the embed image; return the message."""
+        if name not in self.data:
+            return await send(embed=embed, **kwargs)
+        
+        url = self.fresh_url(name) or await self.upload(name)
+        if url:
+            embed.set_image(url=url)
+            return await send(embed=embed, **kwargs)
+        
+        embed.set_image(url=f"attachment://{name}")
+        message = await send(embed=embed, file=discord.File(BytesIO(self.data[name]), filename=name), **kwargs)
+        url = next((e.image.url for e in message.embeds if e.image and e.image.url), None)
+        url = url or next((a.url for a in message.attachments if a.filename == name), None)
+        if url:
+            self.remember(name, message, url)
+        return message
+
+session_assets = SessionAssets(SESSION_ASSET_FILES)
+
+@timed_event
+async def on_raw_message_delete(payload):
+    session_assets.forget_message(payload.message_id)
+
+@timed_event
+async def on_raw_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        session_assets.forget_message(message_id)
+
+# ----- SESSION REGISTRY -----
+SESSION_PHASES = ("startup", "early_access", "released", "ended")
+
+class SessionRegistry:
+    """The current session (host, messages, cohosts, phase), persisted in settings so a restart keeps it."""
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.phase = data.get('phase', "ended")
+        self.host_id = data.get('host_id')
+        self.startup_message_id = data.get('startup_message_id')
+        self.required_reactions = data.get('required_reactions')
+        self.message_id = data.get('message_id')
+        self.link_message_ids = data.get('link_message_ids', [])
+        self.cohosts = data.get('cohosts', [])
+
+    @property
+    def is_released(self):
+        return self.phase in ("early_access", "released") and self.message_id is not None
+
+    def to_dict(self):
+        return {
+            'phase': self.phase,
+            'host_id': self.host_id,
+            'startup_message_id': self.startup_message_id,
+            'required_reactions': self.required_reactions,
+            'message_id': self.message_id,
+            'link_message_ids': self.link_message_ids,
+            'cohosts': self.cohosts,
+        }
+
+    async def save(self):
+        await update_setting('session', self.to_dict())
+
+    async def _forget_links(self):
+        for message_id in self.link_message_ids:
+            await forget_view(message_id)
+        self.link_message_ids = []
+
+    async def start(self, message, host_id, required_reactions):
+        # A new startup replaces whatever session came before it, ended or not.
+        await self._forget_links()
+        self.phase = "startup"
+        self.host_id = host_id
+        self.startup_message_id = message.id
+        self.required_reactions = required_reactions
+        self.message_id = None
+        self.cohosts = []
+        await self.save()
+
+    async def release(self, message, host_id, phase):
+        self.phase = phase
+        self.host_id = host_id
+        self.message_id = message.id
+        self.link_message_ids.append(message.id)
+        self.cohosts = []
+        await self.save()
+
+    async def add_cohost(self, user_id):
+        if user_id in self.cohosts:
+            return False
+        self.cohosts.append(user_id)
+        await self.save()
+        return True
+
+    async def remove_cohost(self, user_id):
+        if user_id not in self.cohosts:
+            return False
+        self.cohosts.remove(user_id)
+        await self.save()
+        return True
+
+    async def end(self):
+        await self._forget_links()
+        self.phase = "ended"
+        self.startup_message_id = None
+        self.message_id = None
+        self.cohosts = []
+        await self.save()
+
+session = SessionRegistry(settings.get('session'))
+
+# ----- OUTBOUND QUEUE -----
+PRIORITY_REPLY = 0
+PRIORITY_ANNOUNCE = 1
+PRIORITY_LOG = 2
+PRIORITY_NAMES = ("reply", "announce", "log")
+
+class MessageDropped(Exception):
+    """Set on a queued send's future when log back-pressure drops it before it is sent."""
+
+class OutboundQueue:
+    """Channel sends queued per channel, highest priority first, paced by a per-channel token bucket."""
+
+    def __init__(self, rate, per, log_backlog):
+        self.rate = rate
+        self.per = per
+        self.log_backlog = log_backlog
+        # channel id -> one deque per priority of (queued_at, priority, send_func, args, kwargs, future)
+        self.buckets = {}
+        # channel id -> (tokens, last refill)
+        self.tokens = {}
+        self.workers = {}
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.dropped = [0] * len(PRIORITY_NAMES)
+        self.wait_total = [0.0] * len(PRIORITY_NAMES)
+        self.wait_max = [0.0] * len(PRIORITY_NAMES)
+        self.throttled = 0
+
+    def depth(self, priority=None):
+        """Messages waiting across all channels, optionally for one priority."""
+        if priority is None:
+            return sum(len(queue) for queues in self.buckets.values() for queue in queues)
+        return sum(len(queues[priority]) for queues in self.buckets.values())
+
+    def send(self, channel, *args, priority=PRIORITY_REPLY, send_func=None, **kwargs):
+        """Queue channel.send(*args, **kwargs) (or send_func) and return a future for the sent message."""
+        future = asyncio.get_running_loop().create_future()
+        queues = self.buckets.get(channel.id)
+        if queues is None:
+            queues = self.buckets[channel.id] = tuple(deque() for _ in PRIORITY_NAMES)
+        
+        queue = queues[priority]
+        if priority == PRIORITY_LOG and len(queue) >= self.log_backlog:
+            # Back-pressure: a log channel that can't keep up loses its oldest entries, never replies.
+            dropped = queue.popleft()
+            if not dropped[5].done():
+                dropped[5].set_exception(MessageDropped("log backlog full, message dropped"))
+            self.dropped[priority] += 1
+        queue.append((time.perf_counter(), priority, send_func or channel.send, args, kwargs, future))
+        
+        worker = self.workers.get(channel.id)
+        if worker is None or worker.done():
+            self.workers[channel.id] = spawn(self._drain(channel.id))
+        return future
+
+    def post(self, channel, *args, priority=PRIORITY_LOG, **kwargs):
+        """Fire-and-forget send; failures are logged instead of raised."""
+        if channel is None:
+            return
+        self.send(channel, *args, priority=priority, **kwargs).add_done_callback(self._report)
+
+    def sender(self, channel, priority, send_func=None):
+        """A channel.send (or message.reply) stand-in that goes through the queue, for helpers that take a send function."""
+        async def send(*args, **kwargs):
+            return await self.send(channel, *args, priority=priority, send_func=send_func, **kwargs)
+        return send
+
+    def _report(self, future):
+        if future.cancelled() or isinstance(future.exception(), MessageDropped):
+            return
+        if future.exception() is not None:
+            print(f"Error sending queued message: {future.exception()}")
+
+    async def _acquire(self, channel_id):
+        now = time.monotonic()
+        tokens, updated = self.tokens.get(channel_id, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - updated) * self.rate / self.per)
+        if tokens < 1:
+            self.throttled += 1
+            await asyncio.sleep((1 - tokens) * self.per / self.rate)
+            now = time.monotonic()
+            tokens = 1
+        self.tokens[channel_id] = (tokens - 1, now)
+
+    async def _drain(self, channel_id):
+        queues = self.buckets[channel_id]
+        while True:
+            queue = next((queue for queue in queues if queue), None)
+            if queue is None:
+                break
+            queued_at, priority, send_func, args, kwargs, future = queue.popleft()
+            if future.done():
+                continue
+            
+            await self._acquire(channel_id)
+            waited = time.perf_counter() - queued_at
+            self.wait_total[priority] += waited
+            self.wait_max[priority] = max(self.wait_max[priority], waited)
+            try:
+                message = await send_func(*args, **kwargs)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self.sent[priority] += 1
+            if not future.done():
+                future.set_result(message)
+        
+        del self.buckets[channel_id]
+        del self.workers[channel_id]
+
+outbox = OutboundQueue(CHANNEL_SEND_RATE, CHANNEL_SEND_PER_SECONDS, OUTBOUND_LOG_BACKLOG)
+
+class QueuedContext(commands.Context):
+    """Command context whose channel replies go through the outbound queue; interaction responses stay direct."""
+
+    async def send(self, content=None, **kwargs):
+        if self.interaction is not None:
+            return await super().send(content, **kwargs)
+        return await outbox.send(self.channel, content, send_func=super().send, **kwargs)
+
+async def process_commands(message):
+    """bot.process_commands, but invoking with a QueuedContext."""
+    if message.author.bot:
+        return
+    ctx = await bot.get_context(message, cls=QueuedContext)
+    await bot.invoke(ctx)
+
+# ----- STAFF LOG -----
+class LogAggregator:
+    """Buffers log events per channel for a short window and sends them as multi-embed messages, in order."""
+
+    MAX_EMBEDS = 10
+    MAX_MESSAGE_CHARS = 6000
+    MAX_DESCRIPTION_CHARS = 4096
+
+    def __init__(self, window):
+        self.window = window
+        # channel id -> (channel, [(timestamp, content, embed)])
+        self.buffers = {}
+        self.events = 0
+        self.messages = 0
+
+    def post(self, channel, content=None, embed=None):
+        if channel is None:
+            return
+        self.events += 1
+        if channel.id not in self.buffers:
+            self.buffers[channel.id] = (channel, [])
+            asyncio.get_running_loop().call_later(self.window, self.flush, channel.id)
+        self.buffers[channel.id][1].append((discord.utils.utcnow(), content, embed))
+
+    def pack(self, events):
+        """Turn buffered events into embeds, rolling consecutive text lines into one embed."""
+        embeds = []
+        text = None
+        for timestamp, content, embed in events:
+            if content:
+                if text is None or len(text.description) + len(content) + 1 > self.MAX_DESCRIPTION_CHARS:
+                    text = discord.Embed(description=content[:self.MAX_DESCRIPTION_CHARS], color=discord.Color.dark_grey(), timestamp=timestamp)
+                    embeds.append(text)
+                else:
+                    text.description += "\n" + content
+            if embed is not None:
+                embeds.append(embed)
+                text = None
+        return embeds
+
+    def flush(self, channel_id):
+        channel, events = self.buffers.pop(channel_id)
+        batch = []
+        chars = 0
+        for embed in self.pack(events):
+            if batch and (len(batch) == self.MAX_EMBEDS or chars + len(embed) > self.MAX_MESSAGE_CHARS):
+                self.send(channel, batch)
+                batch = []
+                chars = 0
+            batch.append(embed)
+            chars += len(embed)
+        if batch:
+            self.send(channel, batch)
+
+    def send(self, channel, embeds):
+        self.messages += 1
+        outbox.post(channel, embeds=embeds, priority=PRIORITY_LOG)
+
+staff_log = LogAggregator(LOG_BATCH_WINDOW_SECONDS)
+
+# ----- MESSAGE PIPELINE -----
+background_tasks = set()
+
+def spawn(coro):
+    """Run coro as a background task, keeping a reference until it finishes and logging failures."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+def _background_done(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"Error in background task: {task.exception()}")
+
+class StageTimer:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+class MessagePipeline:
+    """Runs the on_message stages in order, timing each one.
+
+    A stage returns True to stop the message there (e.g. automod deleted it).
+    Stages hand their user-facing sends to the outbound queue so a slow send
+    never holds up the stages behind it or command processing.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.timers = {stage.__name__: StageTimer() for stage in self.stages}
+
+    async def run(self, message):
+        """Return True if a stage stopped the message."""
+        for stage in self.stages:
+            start = time.perf_counter()
+            try:
+                stopped = await stage(message)
+            except Exception as e:
+                print(f"Error in {stage.__name__}: {e}")
+                stopped = False
+            self.timers[stage.__name__].record(time.perf_counter() - start)
+            if stopped:
+                return True
+        return False
+
+user_afk = {}
+
 async def on_message_leveling(message):
-    if message.author.id not in user_levels:
-        user_levels[message.author.id] = {'xp': 0, 'level': 1}
+    profile = get_profile(message.author.id)
+    profile.xp += random.randint(10, 25)
+    store.mark_levels(message.author.id)
+    level_index.mark(message.author.id)
     
-    xp_gain = random.randint(10, 25)
-    user_levels[message.author.id]['xp'] += xp_gain
-    
-    current_level = user_levels[message.author.id]['level']
-    xp_needed = current_level * 100
-    
-    if user_levels[message.author.id]['xp'] >= xp_needed:
-        user_levels[message.author.id]['level'] += 1
-        user_levels[message.author.id]['xp'] = 0
-        await message.channel.send(f"🎉 {message.author.mention} leveled up to level {user_levels[message.author.id]['level']}!", delete_after=5)
+    if profile.xp >= profile.level * 100:
+        profile.level += 1
+        profile.xp = 0
+        outbox.post(message.channel, f"🎉 {message.author.mention} leveled up to level {profile.level}!", delete_after=5, priority=PRIORITY_REPLY)
 
 async def on_message_economy(message):
-    if message.author.id not in user_economy:
-        user_economy[message.author.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
-    
-    coins_gain = random.randint(5, 15)
-    user_economy[message.author.id]['wallet'] += coins_gain
+    profile = get_profile(message.author.id)
+    profile.wallet += random.randint(5, 15)
+    store.mark_economy(message.author.id)
+    wealth_index.mark(message.author.id)
 
 async def on_message_afk_check(message):
     if message.author.id in user_afk:
         reason = user_afk[message.author.id]
         del user_afk[message.author.id]
-        await message.channel.send(f"Welcome back {message.author.mention}! I removed your AFK status.", delete_after=5)
+        outbox.post(message.channel, f"Welcome back {message.author.mention}! I removed your AFK status.", delete_after=5, priority=PRIORITY_REPLY)
     
     for mention in message.mentions:
         if mention.id in user_afk:
             reason = user_afk[mention.id]
-            await message.channel.send(f"{mention.display_name} is currently AFK: {reason}", delete_after=10)
+            outbox.post(message.channel, f"{mention.display_name} is currently AFK: {reason}", delete_after=10, priority=PRIORITY_REPLY)
+
+# ----- AUTOMOD -----
+bad_words = []
+
+# Look-alike letters folded onto the ASCII letter they imitate before matching.
+CONFUSABLES = {
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p',
+    'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ї': 'i', 'ј': 'j', 'ѕ': 's', 'ԁ': 'd',
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p',
+    'τ': 't', 'υ': 'u', 'χ': 'x', 'ω': 'w'
+}
+CONFUSABLE_TABLE = str.maketrans(CONFUSABLES)
+# Leetspeak digits and symbols; only folded inside words that also contain letters ("h3ll", not "$455").
+LEETSPEAK = {
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '9': 'g',
+    '@': 'a', '$': 's', '!': 'i', '|': 'l', '+': 't', '€': 'e', '£': 'l'
+}
+LEETSPEAK_TABLE = str.maketrans(LEETSPEAK)
+LEETSPEAK_CHARS = re.compile('[' + re.escape(''.join(LEETSPEAK)) + ']')
+LEETSPEAK_WORD = re.compile(r'\S*[a-z]\S*')
+# Mentions, channel links, custom emoji and URLs are ids, not words.
+IGNORED_SPANS = re.compile(r'<(?:@[!&]?|#)\d+>|<a?:\w+:\d+>|https?://\S+|www\.\S+', re.IGNORECASE)
+
+def normalize_text(text):
+    """Fold case, accents, look-alike characters and leetspeak so variants compare equal."""
+    text = IGNORED_SPANS.sub(' ', text)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.casefold().translate(CONFUSABLE_TABLE)
+    if LEETSPEAK_CHARS.search(text):
+        text = LEETSPEAK_WORD.sub(lambda match: match.group().translate(LEETSPEAK_TABLE), text)
+    return text
+
+class WordMatcher:
+    """All bad words compiled into one trie-shaped regex over normalized text.
+
+    Every letter is matched as a run (``ff*uu*cc*kk*``), so stretched spellings
+    hit without collapsing real double letters in the words themselves. Runs are
+    spelled ``xx*`` rather than ``x+`` so each branch starts with a literal, which
+    lets the regex engine skip positions that can't start a match.
+    """
+
+    def __init__(self, words=()):
+        self.pattern = None
+        self.update(words)
+
+    def update(self, words):
+        trie = {}
+        for word in words:
+            word = normalize_text(word).strip()
+            if not word:
+                continue
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[''] = {}
+        self.pattern = re.compile(self._build(trie)) if trie else None
+
+    def _build(self, node):
+        # A word ending here already matches, so longer words sharing this prefix add nothing.
+        if '' in node:
+            return ''
+        branches = [re.escape(ch) * 2 + '*' + self._build(child) for ch, child in sorted(node.items())]
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    def search(self, text):
+        if self.pattern is None:
+            return None
+        return self.pattern.search(normalize_text(text))
+
+word_matcher = WordMatcher(bad_words)
+
+def set_bad_words(words):
+    """Replace the automod word list and recompile the matcher."""
+    bad_words[:] = words
+    word_matcher.update(bad_words)
 
 async def on_message_automod(message):
-    if any(word in message.content.lower() for word in bad_words):
-        await message.delete()
-        await message.channel.send(f"{message.author.mention}, please watch your language!", delete_after=5)
-
-@bot.event
+    if word_matcher.search(message.content):
+        spawn(remove_bad_message(message))
+        return True
+
+async def remove_bad_message(message):
+    await message.delete()
+    outbox.post(message.channel, f"{message.author.mention}, please watch your language!", delete_after=5, priority=PRIORITY_REPLY)
+
+# Automod goes first so deleted messages earn nothing and aren't treated as commands.
+message_pipeline = MessagePipeline([
+    on_message_automod,
+    on_message_leveling,
+    on_message_economy,
+    on_message_afk_check
+])
+
+@timed_event
 async def on_message(message):
     """Track ticket activity and call all message handlers"""
+    bot_metrics.messages += 1
     if message.author.bot:
-        await bot.process_commands(message)
+        await process_commands(message)
         return
     
-    if message.channel.category_id == TICKET_CATEGORY_ID:
-        ticket_last_activity[message.channel.id] = datetime.now(datetime.timezone.utc)
-        if message.channel.id in ticket_warnings_sent:
-            del ticket_warnings_sent[message.channel.id]
+    if is_ticket_channel(message.channel):
+        touch_ticket(message.channel.id)
     
-    await on_message_leveling(message)
-    await on_message_economy(message)
-    await on_message_afk_check(message)
-    await on_message_automod(message)
+    if await message_pipeline.run(message):
+        return
     
-    await bot.process_commands(message)
+    await process_commands(message)
 
-@bot.event
+@timed_event
 async def on_reaction_add(reaction, user):
-    """Handle ticket close reaction and reaction roles"""
+    """Handle ticket close reaction"""
     if user.bot:
         return
     
@@ -351,59 +1886,201 @@ async def on_reaction_add(reaction, user):
         channel = reaction.message.channel
         
         await channel.send("🔒 Ticket closed due to inactivity.")
-        await asyncio.sleep(3)
+        await asyncio.gather(
+            log_ticket_transcript(channel, user, "Inactivity"),
+            asyncio.sleep(3)
+        )
         await channel.delete()
+        forget_ticket(channel.id)
+
+# ----- ROLE MUTATIONS -----
+class RoleMutator:
+    """Collects role adds/removes per member for a short window and applies them with one member.edit call."""
+
+    def __init__(self, window):
+        self.window = window
+        # (guild_id, member_id) -> {'member', 'add', 'remove', 'reasons', 'futures', 'calls'}
+        self.pending = {}
+        self.requested_calls = 0
+        self.edits = 0
+
+    @property
+    def saved_calls(self):
+        """REST calls avoided compared to add_roles/remove_roles, which make one request per role."""
+        return self.requested_calls - self.edits
+
+    def change(self, member, add=(), remove=(), reason=None):
+        """Queue role changes for member; the returned future resolves once they have been applied."""
+        if any(role is None for role in (*add, *remove)):
+            raise ValueError("role change requested for a role that doesn't exist")
+        key = (member.guild.id, member.id)
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = {'member': member, 'add': {}, 'remove': {}, 'reasons': [], 'futures': [], 'calls': 0}
+            asyncio.get_running_loop().call_later(self.window, lambda: spawn(self.flush(key)))
+        
+        # The most recent request for a role wins.
+        for role in add:
+            batch['remove'].pop(role.id, None)
+            batch['add'][role.id] = role
+        for role in remove:
+            batch['add'].pop(role.id, None)
+            batch['remove'][role.id] = role
+        if reason and reason not in batch['reasons']:
+            batch['reasons'].append(reason)
+        batch['calls'] += len(add) + len(remove)
         
-        if channel.id in ticket_last_activity:
-            del ticket_last_activity[channel.id]
-        if channel.id in ticket_warnings_sent:
-            del ticket_warnings_sent[channel.id]
+        future = asyncio.get_running_loop().create_future()
+        batch['futures'].append(future)
+        return future
+
+    async def flush(self, key):
+        """Apply one member's batch; every waiting future is resolved however this ends.
+
+        The role list is rebuilt from the gateway-updated member cache at flush
+        time, so changes other actors made during the window are kept. A change
+        whose gateway event hasn't arrived yet when the edit goes out can still
+        be overwritten; the window is kept short for that reason.
+        """
+        batch = self.pending.pop(key)
+        error = None
+        try:
+            member = batch['member'].guild.get_member(key[1]) or batch['member']
+            self.requested_calls += batch['calls']
+            
+            current = [role for role in member.roles if not role.is_default()]
+            roles = [role for role in current if role.id not in batch['remove']]
+            roles.extend(role for role in batch['add'].values() if role not in roles)
+            
+            if set(roles) != set(current):
+                await member.edit(roles=roles, reason="; ".join(batch['reasons']) or None)
+                self.edits += 1
+        except Exception as e:
+            print(f"Error updating roles for member {key[1]}: {e}")
+            error = e
+        finally:
+            for future in batch['futures']:
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+role_mutator = RoleMutator(ROLE_MUTATION_WINDOW_SECONDS)
+
+# ----- REACTION ROLES -----
+class ReactionRoleQueue:
+    """Applies reaction-role changes in batches of up to batch_size, interval apart, instead of bursting REST calls.
+
+    Each batch goes through the role mutator, so one member's changes within it
+    become a single edit.
+    """
+
+    def __init__(self, interval, batch_size=10):
+        self.interval = interval
+        self.batch_size = batch_size
+        # (guild_id, user_id, role_id) -> add?; a later reaction overrides an earlier one that hasn't run yet.
+        self.pending = {}
+        self.order = deque()
+        self.wakeup = asyncio.Event()
+        self.applied = 0
+        self.collapsed = 0
+
+    def push(self, guild_id, user_id, role_id, add):
+        key = (guild_id, user_id, role_id)
+        if key in self.pending:
+            self.collapsed += 1
+        else:
+            self.order.append(key)
+        self.pending[key] = add
+        self.wakeup.set()
+
+    def apply(self, guild_id, user_id, role_id, add):
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            return None
+        member = guild.get_member(user_id)
+        role = guild.get_role(role_id)
+        if member is None or role is None or (role in member.roles) == add:
+            return None
+        
+        self.applied += 1
+        if add:
+            return role_mutator.change(member, add=[role], reason="Reaction role")
+        return role_mutator.change(member, remove=[role], reason="Reaction role")
+
+    async def run(self):
+        while not bot.is_closed():
+            if not self.order:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            
+            # Hand a batch to the role mutator so several reactions from one member become one edit.
+            futures = []
+            while self.order and len(futures) < self.batch_size:
+                key = self.order.popleft()
+                future = self.apply(*key, self.pending.pop(key))
+                if future is not None:
+                    futures.append(future)
+            await asyncio.gather(*futures, return_exceptions=True)
+            await asyncio.sleep(self.interval)
+
+reaction_role_queue = ReactionRoleQueue(REACTION_ROLE_INTERVAL_SECONDS)
+
+async def add_reaction_role(message_id, emoji, role_id):
+    reaction_roles[(message_id, emoji)] = role_id
+    await store.save_reaction_role(message_id, emoji, role_id)
+
+@timed_event
+async def on_raw_reaction_add(payload):
+    """Count giveaway entries and grant reaction roles straight from the gateway, cached message or not"""
+    if payload.user_id == bot.user.id or (payload.member is not None and payload.member.bot):
+        return
     
-    if (reaction.message.id, str(reaction.emoji)) in reaction_roles:
-        role_id = reaction_roles[(reaction.message.id, str(reaction.emoji))]
-        role = reaction.message.guild.get_role(role_id)
-        if role:
-            await user.add_roles(role)
+    emoji = str(payload.emoji)
+    if payload.message_id in active_giveaways and emoji == "🎉":
+        giveaway_entries.add(payload.message_id, payload.user_id)
+    
+    role_id = reaction_roles.get((payload.message_id, emoji))
+    if role_id is not None and payload.guild_id is not None:
+        reaction_role_queue.push(payload.guild_id, payload.user_id, role_id, True)
 
-@bot.event
-async def on_reaction_remove(reaction, user):
-    """Handle reaction role removal"""
-    if user.bot:
-        return
+@timed_event
+async def on_raw_reaction_remove(payload):
+    """Drop giveaway entries and reaction roles when the reaction is taken back"""
+    emoji = str(payload.emoji)
+    if payload.message_id in active_giveaways and emoji == "🎉":
+        giveaway_entries.remove(payload.message_id, payload.user_id)
     
-    if (reaction.message.id, str(reaction.emoji)) in reaction_roles:
-        role_id = reaction_roles[(reaction.message.id, str(reaction.emoji))]
-        role = reaction.message.guild.get_role(role_id)
-        if role:
-            await user.remove_roles(role)
+    role_id = reaction_roles.get((payload.message_id, emoji))
+    if role_id is not None and payload.guild_id is not None:
+        reaction_role_queue.push(payload.guild_id, payload.user_id, role_id, False)
 
 @bot.command()
 async def announce(ctx, *, message):
     channel = bot.get_channel(ANNOUNCEMENTS_CHANNEL_ID)
     embed = discord.Embed(description=message, color=discord.Color.orange())
-    await channel.send(embed=embed)
+    await outbox.send(channel, embed=embed, priority=PRIORITY_ANNOUNCE)
     await ctx.send("✓ Announcement sent!", delete_after=3)
 
 @bot.command()
 async def type(ctx, channel: discord.TextChannel, *, message):
-    await channel.send(message)
+    await outbox.send(channel, message, priority=PRIORITY_ANNOUNCE)
     await ctx.send(f"✓ Message sent to {channel.mention}!", delete_after=3)
 
 from datetime import datetime, timezone
 
 # ----- TICKET BUTTON COMMAND -----
-@bot.command()
-async def ticketbutton(ctx):
-    """Send the 'Create Ticket' button to TICKET_CHANNEL_ID"""
-    channel = bot.get_channel(TICKET_CHANNEL_ID)
-    embed = discord.Embed(
-        title="Create a Ticket",
-        description="Press the button below to create a ticket.",
-        color=discord.Color.orange()
-    )
-    button = Button(label="Create Ticket", style=discord.ButtonStyle.green)
+class TicketPanelView(View):
+    """The persistent 'Create Ticket' button; one instance registered at startup serves every panel."""
+
+    def __init__(self):
+        super().__init__(timeout=None)
 
-    async def button_callback(interaction):
+    @discord.ui.button(label="Create Ticket", style=discord.ButtonStyle.green, custom_id="ticket:create")
+    async def create_ticket(self, interaction: discord.Interaction, button: Button):
         modal = Modal(title="Ticket Reason")
         reason_input = TextInput(label="Reason", placeholder="Why are you opening this ticket?")
         modal.add_item(reason_input)
@@ -429,7 +2106,7 @@ async def ticketbutton(ctx):
                 overwrites=overwrites
             )
 
-            ticket_last_activity[ticket_channel.id] = datetime.now(timezone.utc)
+            touch_ticket(ticket_channel.id)
 
             # Embed inside the ticket
             ticket_embed = discord.Embed(
@@ -438,55 +2115,19 @@ async def ticketbutton(ctx):
                 color=discord.Color.orange()
             )
 
-            # Close button
-            class CloseButton(View):
-                def __init__(self, creator):
-                    super().__init__(timeout=None)
-                    self.creator = creator
-
-                @discord.ui.button(label="🔒 Close Ticket", style=discord.ButtonStyle.red)
-                async def close_ticket(self, button_interaction: discord.Interaction, button: Button):
-                    if button_interaction.user != self.creator and staff_role not in button_interaction.user.roles:
-                        await button_interaction.response.send_message(
-                            "❌ You don’t have permission to close this ticket.", ephemeral=True
-                        )
-                        return
-
-                    close_modal = Modal(title="Close Ticket Reason")
-                    close_reason = TextInput(label="Reason for closing", placeholder="Enter a reason...")
-                    close_modal.add_item(close_reason)
-
-                    async def close_submit(close_inter):
-                        # Log history
-                        if STAFF_LOG_CHANNEL_ID:
-                            log_channel = guild.get_channel(STAFF_LOG_CHANNEL_ID)
-                            messages = [m async for m in ticket_channel.history(limit=100)]
-                            history_text = "\n".join([f"{m.author}: {m.content}" for m in reversed(messages)])
-                            await log_channel.send(
-                                f"Ticket {ticket_channel.name} closed by {close_inter.user}.\n"
-                                f"Reason: {close_reason.value}\nHistory:\n```{history_text[:1900]}```"
-                            )
-
-                        await close_inter.response.send_message("✅ Ticket will close in 3 seconds...", ephemeral=True)
-                        await asyncio.sleep(3)
-                        await ticket_channel.delete()
-
-                    close_modal.on_submit = close_submit
-                    await button_interaction.response.send_modal(close_modal)
-
-            view = CloseButton(modal_interaction.user)
-
             # Send ticket embed + staff ping + Close button
-            await ticket_channel.send(
+            ticket_message = await outbox.send(
+                ticket_channel,
                 content=f"<@&{STAFF_ROLE_ID}> {modal_interaction.user.mention} created a ticket!",
                 embed=ticket_embed,
-                view=view
+                view=TicketCloseView()
             )
+            await remember_view(ticket_message, "ticket_close", creator_id=modal_interaction.user.id)
 
             # Log ticket creation
             if STAFF_LOG_CHANNEL_ID:
                 log_channel = guild.get_channel(STAFF_LOG_CHANNEL_ID)
-                await log_channel.send(f"Ticket created by {modal_interaction.user} in {ticket_channel.mention}")
+                staff_log.post(log_channel, f"Ticket created by {modal_interaction.user} in {ticket_channel.mention}")
 
             # Notify user that ticket was created
             await modal_interaction.followup.send(
@@ -496,10 +2137,55 @@ async def ticketbutton(ctx):
         modal.on_submit = modal_callback
         await interaction.response.send_modal(modal)
 
-    button.callback = button_callback
-    view = View(timeout=None)
-    view.add_item(button)
-    await channel.send(embed=embed, view=view)
+class TicketCloseView(View):
+    """The persistent close button inside a ticket; the creator is looked up in view_state."""
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="🔒 Close Ticket", style=discord.ButtonStyle.red, custom_id="ticket:close")
+    async def close_ticket(self, button_interaction: discord.Interaction, button: Button):
+        ticket_channel = button_interaction.channel
+        ticket_message_id = button_interaction.message.id
+        staff_role = button_interaction.guild.get_role(TICKET_STAFF_ROLE_ID)
+        creator_id = view_state.get(ticket_message_id, {}).get('creator_id')
+        if button_interaction.user.id != creator_id and staff_role not in button_interaction.user.roles:
+            await button_interaction.response.send_message(
+                "❌ You don’t have permission to close this ticket.", ephemeral=True
+            )
+            return
+
+        close_modal = Modal(title="Close Ticket Reason")
+        close_reason = TextInput(label="Reason for closing", placeholder="Enter a reason...")
+        close_modal.add_item(close_reason)
+
+        async def close_submit(close_inter):
+            await close_inter.response.send_message("✅ Ticket will close in 3 seconds...", ephemeral=True)
+            # Log the full history before the channel goes away
+            await asyncio.gather(
+                log_ticket_transcript(ticket_channel, close_inter.user, close_reason.value),
+                asyncio.sleep(3)
+            )
+            await ticket_channel.delete()
+            forget_ticket(ticket_channel.id)
+            await forget_view(ticket_message_id)
+
+        close_modal.on_submit = close_submit
+        await button_interaction.response.send_modal(close_modal)
+
+def ticket_panel_embed():
+    return discord.Embed(
+        title="Create a Ticket",
+        description="Press the button below to create a ticket.",
+        color=discord.Color.orange()
+    )
+
+@bot.command()
+async def ticketbutton(ctx):
+    """Send the 'Create Ticket' button to TICKET_CHANNEL_ID"""
+    channel = bot.get_channel(TICKET_CHANNEL_ID)
+    message = await outbox.send(channel, embed=ticket_panel_embed(), view=TicketPanelView(), priority=PRIORITY_ANNOUNCE)
+    await update_setting('ticket_panel_message_id', message.id)
     await ctx.send("✅ Ticket button sent!", delete_after=3)
 
 @bot.command()
@@ -514,7 +2200,7 @@ async def timeout(ctx, member: discord.Member, duration: int, *, reason: str = "
     
     if STAFF_LOG_CHANNEL_ID:
         log_channel = ctx.guild.get_channel(STAFF_LOG_CHANNEL_ID)
-        await log_channel.send(f"🔇 {member.mention} was timed out by {ctx.author.mention} for {duration} minutes.\nReason: {reason}")
+        staff_log.post(log_channel, f"🔇 {member.mention} was timed out by {ctx.author.mention} for {duration} minutes.\nReason: {reason}")
 
 @bot.command()
 async def untimeout(ctx, member: discord.Member):
@@ -528,7 +2214,7 @@ async def untimeout(ctx, member: discord.Member):
     
     if STAFF_LOG_CHANNEL_ID:
         log_channel = ctx.guild.get_channel(STAFF_LOG_CHANNEL_ID)
-        await log_channel.send(f"🔊 {member.mention} was removed from timeout by {ctx.author.mention}.")
+        staff_log.post(log_channel, f"🔊 {member.mention} was removed from timeout by {ctx.author.mention}.")
 
 @bot.command()
 async def kick(ctx, member: discord.Member, *, reason: str = "No reason provided"):
@@ -542,7 +2228,7 @@ async def kick(ctx, member: discord.Member, *, reason: str = "No reason provided
     
     if STAFF_LOG_CHANNEL_ID:
         log_channel = ctx.guild.get_channel(STAFF_LOG_CHANNEL_ID)
-        await log_channel.send(f"👢 {member.mention} was kicked by {ctx.author.mention}.\nReason: {reason}")
+        staff_log.post(log_channel, f"👢 {member.mention} was kicked by {ctx.author.mention}.\nReason: {reason}")
 
 @bot.command()
 async def ban(ctx, member: discord.Member, *, reason: str = "No reason provided"):
@@ -556,7 +2242,7 @@ async def ban(ctx, member: discord.Member, *, reason: str = "No reason provided"
     
     if STAFF_LOG_CHANNEL_ID:
         log_channel = ctx.guild.get_channel(STAFF_LOG_CHANNEL_ID)
-        await log_channel.send(f"🔨 {member.mention} was banned by {ctx.author.mention}.\nReason: {reason}")
+        staff_log.post(log_channel, f"🔨 {member.mention} was banned by {ctx.author.mention}.\nReason: {reason}")
 
 @bot.command()
 async def clear(ctx, amount: int = 10):
@@ -571,7 +2257,7 @@ async def clear(ctx, amount: int = 10):
     
     if STAFF_LOG_CHANNEL_ID:
         log_channel = ctx.guild.get_channel(STAFF_LOG_CHANNEL_ID)
-        await log_channel.send(f"🗑️ {ctx.author.mention} cleared {len(deleted) - 1} messages in {ctx.channel.mention}.")
+        staff_log.post(log_channel, f"🗑️ {ctx.author.mention} cleared {len(deleted) - 1} messages in {ctx.channel.mention}.")
 
 @bot.hybrid_command()
 async def startup(ctx):
@@ -588,7 +2274,8 @@ async def startup(ctx):
     modal.add_item(reaction_input)
 
     async def modal_callback(modal_interaction):
-        global latest_startup_message_id, latest_startup_host_id
+        # The queued announcement can wait on the channel's rate limit past the 3s interaction deadline.
+        await modal_interaction.response.defer(ephemeral=True)
         session_channel = bot.get_channel(SESSION_CHANNEL_ID)
         ping_mention = " ".join([f"<@&{role_id}>" for role_id in STARTUP_PING_ROLES])
         
@@ -598,17 +2285,11 @@ async def startup(ctx):
             color=discord.Color.orange()
         )
 
-        try:
-            file = discord.File("startup.png", filename="startup.png")
-            embed.set_image(url="attachment://startup.png")
-            message = await session_channel.send(content=ping_mention, embed=embed, file=file)
-        except FileNotFoundError:
-            message = await session_channel.send(content=ping_mention, embed=embed)
+        message = await session_assets.send(outbox.sender(session_channel, PRIORITY_ANNOUNCE), "startup.png", embed, content=ping_mention)
         
         await message.add_reaction("✅")
         
-        latest_startup_message_id = message.id
-        latest_startup_host_id = ctx.author.id
+        await session.start(message, ctx.author.id, reaction_input.value)
         
         log_channel = bot.get_channel(RELEASE_LOG_CHANNEL)
         if log_channel:
@@ -618,9 +2299,9 @@ async def startup(ctx):
                 color=discord.Color.orange(),
                 timestamp=modal_interaction.created_at
             )
-            await log_channel.send(embed=log_embed)
+            staff_log.post(log_channel, embed=log_embed)
         
-        await modal_interaction.response.send_message(f"✓ Session startup announced in {session_channel.mention}!", ephemeral=True)
+        await modal_interaction.followup.send(f"✓ Session startup announced in {session_channel.mention}!", ephemeral=True)
 
     modal.on_submit = modal_callback
     
@@ -643,6 +2324,26 @@ async def startup(ctx):
             pass
         await ctx.send("Click the button below to start a session:", view=view, ephemeral=True)
 
+class SessionLinkView(View):
+    """The persistent 'Get Session Link' button; the link and allowed roles live in view_state."""
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Get Session Link", style=discord.ButtonStyle.green, custom_id="session:link")
+    async def get_link(self, interaction: discord.Interaction, button: discord.ui.Button):
+        state = view_state.get(interaction.message.id)
+        if state is None:
+            await interaction.response.send_message("❌ This session link is no longer available.", ephemeral=True)
+            return
+        
+        allowed_roles = state['allowed_roles']
+        member_roles = [role.id for role in interaction.user.roles]
+        if allowed_roles and not any(role in member_roles for role in allowed_roles):
+            await interaction.response.send_message("❌ You don't have permission to get this link.", ephemeral=True)
+            return
+        await interaction.response.send_message(f"🔗 Your session link: {state['link']}", ephemeral=True)
+
 @bot.hybrid_command()
 async def release_early(ctx):
     host_role = ctx.guild.get_role(SESSION_HOST_ROLE_ID)
@@ -658,7 +2359,7 @@ async def release_early(ctx):
     modal.add_item(link_input)
 
     async def modal_callback(modal_interaction):
-        global session_message_id, session_cohosts
+        await modal_interaction.response.defer(ephemeral=True)
         session_channel = bot.get_channel(SESSION_CHANNEL_ID)
         ping_mentions = " ".join([f"<@&{role_id}>" for role_id in RELEASE_PING_ROLES])
         
@@ -668,31 +2369,9 @@ async def release_early(ctx):
             color=discord.Color.orange()
         )
 
-        class LinkButton(View):
-            def __init__(self, allowed_roles, link):
-                super().__init__(timeout=None)
-                self.allowed_roles = allowed_roles
-                self.link = link
-
-            @discord.ui.button(label="Get Session Link", style=discord.ButtonStyle.green)
-            async def get_link(self, interaction: discord.Interaction, button: discord.ui.Button):
-                member_roles = [role.id for role in interaction.user.roles]
-                if any(role in member_roles for role in self.allowed_roles):
-                    await interaction.response.send_message(f"🔗 Your session link: {self.link}", ephemeral=True)
-                else:
-                    await interaction.response.send_message("❌ You don't have permission to get this link.", ephemeral=True)
-
-        view = LinkButton(allowed_roles=RELEASE_PING_ROLES, link=link_input.value)
-        
-        try:
-            file = discord.File("early_release.png", filename="early_release.png")
-            embed.set_image(url="attachment://early_release.png")
-            message = await session_channel.send(content=ping_mentions, embed=embed, file=file, view=view)
-        except FileNotFoundError:
-            message = await session_channel.send(content=ping_mentions, embed=embed, view=view)
-        
-        session_message_id = message.id
-        session_cohosts = []
+        message = await session_assets.send(outbox.sender(session_channel, PRIORITY_ANNOUNCE), "early_release.png", embed, content=ping_mentions, view=SessionLinkView())
+        await remember_view(message, "session_link", link=link_input.value, allowed_roles=RELEASE_PING_ROLES)
+        await session.release(message, ctx.author.id, "early_access")
         
         log_channel = bot.get_channel(RELEASE_LOG_CHANNEL)
         if log_channel:
@@ -702,9 +2381,9 @@ async def release_early(ctx):
                 color=discord.Color.blue(),
                 timestamp=modal_interaction.created_at
             )
-            await log_channel.send(embed=log_embed)
+            staff_log.post(log_channel, embed=log_embed)
         
-        await modal_interaction.response.send_message("✓ Early access released!", ephemeral=True)
+        await modal_interaction.followup.send("✓ Early access released!", ephemeral=True)
 
     modal.on_submit = modal_callback
     
@@ -749,7 +2428,7 @@ async def release(ctx):
     modal.add_item(law_enforcement_input)
 
     async def modal_callback(modal_interaction):
-        global session_message_id, session_cohosts
+        await modal_interaction.response.defer(ephemeral=True)
         session_channel = bot.get_channel(SESSION_CHANNEL_ID)
         ping_mentions = "<@&1429414667226320989> <@&1429032286623498240>"
         
@@ -762,26 +2441,9 @@ async def release(ctx):
         embed.add_field(name="🚗 FRP Speeds", value=frp_speeds_input.value, inline=True)
         embed.add_field(name="👮 Law Enforcement", value=law_enforcement_input.value, inline=True)
 
-        class LinkButton(View):
-            def __init__(self, link):
-                super().__init__(timeout=None)
-                self.link = link
-
-            @discord.ui.button(label="Get Session Link", style=discord.ButtonStyle.green)
-            async def get_link(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.response.send_message(f"🔗 Your session link: {self.link}", ephemeral=True)
-
-        view = LinkButton(link=link_input.value)
-        
-        try:
-            file = discord.File("release.png", filename="release.png")
-            embed.set_image(url="attachment://release.png")
-            message = await session_channel.send(content=ping_mentions, embed=embed, file=file, view=view)
-        except FileNotFoundError:
-            message = await session_channel.send(content=ping_mentions, embed=embed, view=view)
-        
-        session_message_id = message.id
-        session_cohosts = []
+        message = await session_assets.send(outbox.sender(session_channel, PRIORITY_ANNOUNCE), "release.png", embed, content=ping_mentions, view=SessionLinkView())
+        await remember_view(message, "session_link", link=link_input.value, allowed_roles=None)
+        await session.release(message, ctx.author.id, "released")
         
         log_channel = bot.get_channel(RELEASE_LOG_CHANNEL)
         if log_channel:
@@ -791,9 +2453,9 @@ async def release(ctx):
                 color=discord.Color.green(),
                 timestamp=modal_interaction.created_at
             )
-            await log_channel.send(embed=log_embed)
+            staff_log.post(log_channel, embed=log_embed)
         
-        await modal_interaction.response.send_message("✓ Session released!", ephemeral=True)
+        await modal_interaction.followup.send("✓ Session released!", ephemeral=True)
 
     modal.on_submit = modal_callback
     
@@ -823,9 +2485,7 @@ async def addcohost(ctx, member: discord.Member):
         await ctx.send("❌ You need the Session Host role to add co-hosts!")
         return
     
-    global session_cohosts
-    if member.id not in session_cohosts:
-        session_cohosts.append(member.id)
+    if await session.add_cohost(member.id):
         await ctx.send(f"✓ {member.mention} has been added as a co-host!", delete_after=5)
         
         log_channel = bot.get_channel(RELEASE_LOG_CHANNEL)
@@ -836,7 +2496,7 @@ async def addcohost(ctx, member: discord.Member):
                 color=discord.Color.green(),
                 timestamp=ctx.message.created_at
             )
-            await log_channel.send(embed=log_embed)
+            staff_log.post(log_channel, embed=log_embed)
     else:
         await ctx.send(f"❌ {member.mention} is already a co-host!", delete_after=5)
 
@@ -847,9 +2507,7 @@ async def removecohost(ctx, member: discord.Member):
         await ctx.send("❌ You need the Session Host role to remove co-hosts!")
         return
     
-    global session_cohosts
-    if member.id in session_cohosts:
-        session_cohosts.remove(member.id)
+    if await session.remove_cohost(member.id):
         await ctx.send(f"✓ {member.mention} has been removed as a co-host!", delete_after=5)
         
         log_channel = bot.get_channel(RELEASE_LOG_CHANNEL)
@@ -860,7 +2518,7 @@ async def removecohost(ctx, member: discord.Member):
                 color=discord.Color.red(),
                 timestamp=ctx.message.created_at
             )
-            await log_channel.send(embed=log_embed)
+            staff_log.post(log_channel, embed=log_embed)
     else:
         await ctx.send(f"❌ {member.mention} is not a co-host!", delete_after=5)
 
@@ -874,7 +2532,6 @@ async def session_end(ctx):
             await ctx.send("❌ You need the Session Host role to end a session!", ephemeral=True)
         return
     
-    global session_cohosts
     session_channel = bot.get_channel(SESSION_CHANNEL_ID)
     
     embed = discord.Embed(
@@ -883,14 +2540,9 @@ async def session_end(ctx):
         color=discord.Color.red()
     )
     
-    try:
-        file = discord.File("session_end.png", filename="session_end.png")
-        embed.set_image(url="attachment://session_end.png")
-        await session_channel.send(embed=embed, file=file)
-    except FileNotFoundError:
-        await session_channel.send(embed=embed)
+    await session_assets.send(outbox.sender(session_channel, PRIORITY_ANNOUNCE), "session_end.png", embed)
     
-    session_cohosts = []
+    await session.end()
     
     log_channel = bot.get_channel(RELEASE_LOG_CHANNEL)
     if log_channel:
@@ -900,7 +2552,7 @@ async def session_end(ctx):
             color=discord.Color.red(),
             timestamp=ctx.message.created_at if hasattr(ctx, 'message') else discord.utils.utcnow()
         )
-        await log_channel.send(embed=log_embed)
+        staff_log.post(log_channel, embed=log_embed)
     
     try:
         if hasattr(ctx, 'message'):
@@ -913,9 +2565,7 @@ async def session_end(ctx):
 @bot.hybrid_command()
 async def cohost(ctx):
     """React to the soonest release and become a cohost"""
-    global session_cohosts
-    
-    if len(session_cohosts) >= 3:
+    if len(session.cohosts) >= 3:
         await ctx.send("❌ Maximum of 3 co-hosts reached!", delete_after=5)
         return
     
@@ -924,23 +2574,12 @@ async def cohost(ctx):
         await ctx.send("❌ Session channel not found!", delete_after=5)
         return
     
-    release_message = None
-    async for message in session_channel.history(limit=50):
-        if message.author == bot.user and message.embeds:
-            for embed in message.embeds:
-                if any(keyword in embed.title.lower() for keyword in ["released", "early access", "session"]):
-                    release_message = message
-                    break
-            if release_message:
-                break
-    
-    if not release_message:
+    if not session.is_released:
         await ctx.send("❌ No recent session release found!", delete_after=5)
         return
+    release_message = session_channel.get_partial_message(session.message_id)
     
-    if ctx.author.id not in session_cohosts:
-        session_cohosts.append(ctx.author.id)
-    else:
+    if not await session.add_cohost(ctx.author.id):
         await ctx.send("❌ You're already a co-host!", delete_after=5)
         return
     
@@ -949,17 +2588,15 @@ async def cohost(ctx):
     except:
         pass
     
-    try:
-        file = discord.File("cohost.png", filename="cohost.png")
+    if "cohost.png" in session_assets:
         embed = discord.Embed(
             title="🎉 New Co-Host!",
             description=f"{ctx.author.mention} is now cohosting this session!",
             color=discord.Color.green()
         )
-        embed.set_image(url="attachment://cohost.png")
-        await release_message.reply(content=f"{ctx.author.mention} is now cohosting this session!", embed=embed, file=file)
-    except FileNotFoundError:
-        await release_message.reply(f"{ctx.author.mention} is now cohosting this session!")
+        await session_assets.send(outbox.sender(session_channel, PRIORITY_ANNOUNCE, release_message.reply), "cohost.png", embed, content=f"{ctx.author.mention} is now cohosting this session!")
+    else:
+        await outbox.send(session_channel, f"{ctx.author.mention} is now cohosting this session!", send_func=release_message.reply, priority=PRIORITY_ANNOUNCE)
     
     log_channel = bot.get_channel(RELEASE_LOG_CHANNEL)
     if log_channel:
@@ -969,7 +2606,7 @@ async def cohost(ctx):
             color=discord.Color.green(),
             timestamp=ctx.message.created_at if hasattr(ctx, 'message') else discord.utils.utcnow()
         )
-        await log_channel.send(embed=log_embed)
+        staff_log.post(log_channel, embed=log_embed)
     
     try:
         if hasattr(ctx, 'message'):
@@ -980,9 +2617,7 @@ async def cohost(ctx):
 @bot.command()
 async def setting_up(ctx):
     """Responds to the latest startup message indicating host is setting up"""
-    global latest_startup_message_id, latest_startup_host_id
-    
-    if not latest_startup_message_id or not latest_startup_host_id:
+    if session.phase == "ended" or not session.startup_message_id:
         await ctx.send("❌ No recent startup found!", delete_after=5)
         try:
             await ctx.message.delete()
@@ -1000,10 +2635,14 @@ async def setting_up(ctx):
         return
     
     try:
-        startup_message = await session_channel.fetch_message(latest_startup_message_id)
-        host_user = await ctx.guild.fetch_member(latest_startup_host_id)
+        startup_message = session_channel.get_partial_message(session.startup_message_id)
         
-        await startup_message.reply(f"{host_user.mention} is now setting up the session! Please be patient and allow them to set up to 10 minutes!")
+        await outbox.send(
+            session_channel,
+            f"<@{session.host_id}> is now setting up the session! Please be patient and allow them to set up to 10 minutes!",
+            send_func=startup_message.reply,
+            priority=PRIORITY_ANNOUNCE
+        )
         
         try:
             await ctx.message.delete()
@@ -1023,6 +2662,67 @@ async def setting_up(ctx):
         except:
             pass
 
+class ApplicationReviewView(View):
+    """Persistent Accept/Deny buttons on staff applications; the applicant is looked up in view_state."""
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Accept", style=discord.ButtonStyle.green, custom_id="application:accept")
+    async def accept_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.review(interaction, accepted=True)
+
+    @discord.ui.button(label="Deny", style=discord.ButtonStyle.red, custom_id="application:deny")
+    async def deny_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.review(interaction, accepted=False)
+
+    async def review(self, interaction, accepted):
+        reviewer_role = interaction.guild.get_role(APPLICATION_REVIEWER_ROLE_ID)
+        if reviewer_role not in interaction.user.roles:
+            await interaction.response.send_message("❌ You don't have permission to review applications.", ephemeral=True)
+            return
+        
+        state = view_state.get(interaction.message.id)
+        if state is None:
+            await interaction.response.send_message("❌ This application has already been reviewed.", ephemeral=True)
+            return
+        applicant_id = state['applicant_id']
+        guild = interaction.guild
+        
+        if accepted:
+            modal = Modal(title="Accept Application")
+            reason_input = TextInput(label="Reason for Acceptance", style=discord.TextStyle.paragraph, placeholder="Enter reason...")
+        else:
+            modal = Modal(title="Deny Application")
+            reason_input = TextInput(label="Reason for Denial", style=discord.TextStyle.paragraph, placeholder="Enter reason...")
+        modal.add_item(reason_input)
+        
+        async def modal_callback(modal_interaction):
+            applicant = await guild.fetch_member(applicant_id)
+            if accepted:
+                await modal_interaction.response.send_message(f"✅ Application from {applicant.mention} has been accepted by {interaction.user.mention}!\n**Reason:** {reason_input.value}")
+                dm = f"🎉 Congratulations! Your staff application for **{guild.name}** has been accepted!\n**Reason:** {reason_input.value}"
+            else:
+                await modal_interaction.response.send_message(f"❌ Application from {applicant.mention} has been denied by {interaction.user.mention}.\n**Reason:** {reason_input.value}")
+                dm = f"❌ Unfortunately, your staff application for **{guild.name}** has been denied.\n**Reason:** {reason_input.value}\n\nYou can reapply in the future."
+            
+            try:
+                await applicant.send(dm)
+            except:
+                pass
+            
+            if applicant_id in active_applications:
+                del active_applications[applicant_id]
+            await forget_view(interaction.message.id)
+            
+            reviewed = ApplicationReviewView()
+            for item in reviewed.children:
+                item.disabled = True
+            await interaction.message.edit(view=reviewed)
+        
+        modal.on_submit = modal_callback
+        await interaction.response.send_modal(modal)
+
 @bot.command()
 async def apply(ctx):
     if ctx.author.id in active_applications:
@@ -1090,78 +2790,171 @@ async def apply(ctx):
                 answer = answer[:1021] + "..."
             embed.add_field(name=f"Q{i}: {question[:100]}", value=answer, inline=False)
         
-        class ApplicationButtons(View):
-            def __init__(self, applicant_id, guild_obj):
-                super().__init__(timeout=None)
-                self.applicant_id = applicant_id
-                self.guild_obj = guild_obj
-            
-            @discord.ui.button(label="Accept", style=discord.ButtonStyle.green)
-            async def accept_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-                reviewer_role = interaction.guild.get_role(APPLICATION_REVIEWER_ROLE_ID)
-                if reviewer_role not in interaction.user.roles:
-                    await interaction.response.send_message("❌ You don't have permission to review applications.", ephemeral=True)
-                    return
-                
-                modal = Modal(title="Accept Application")
-                reason_input = TextInput(label="Reason for Acceptance", style=discord.TextStyle.paragraph, placeholder="Enter reason...")
-                modal.add_item(reason_input)
-                
-                async def modal_callback(modal_interaction):
-                    applicant = await self.guild_obj.fetch_member(self.applicant_id)
-                    await modal_interaction.response.send_message(f"✅ Application from {applicant.mention} has been accepted by {interaction.user.mention}!\n**Reason:** {reason_input.value}")
-                    
-                    try:
-                        await applicant.send(f"🎉 Congratulations! Your staff application for **{self.guild_obj.name}** has been accepted!\n**Reason:** {reason_input.value}")
-                    except:
-                        pass
-                    
-                    if self.applicant_id in active_applications:
-                        del active_applications[self.applicant_id]
-                    
-                    for item in self.children:
-                        item.disabled = True
-                    await interaction.message.edit(view=self)
-                
-                modal.on_submit = modal_callback
-                await interaction.response.send_modal(modal)
-            
-            @discord.ui.button(label="Deny", style=discord.ButtonStyle.red)
-            async def deny_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-                reviewer_role = interaction.guild.get_role(APPLICATION_REVIEWER_ROLE_ID)
-                if reviewer_role not in interaction.user.roles:
-                    await interaction.response.send_message("❌ You don't have permission to review applications.", ephemeral=True)
-                    return
-                
-                modal = Modal(title="Deny Application")
-                reason_input = TextInput(label="Reason for Denial", style=discord.TextStyle.paragraph, placeholder="Enter reason...")
-                modal.add_item(reason_input)
-                
-                async def modal_callback(modal_interaction):
-                    applicant = await self.guild_obj.fetch_member(self.applicant_id)
-                    await modal_interaction.response.send_message(f"❌ Application from {applicant.mention} has been denied by {interaction.user.mention}.\n**Reason:** {reason_input.value}")
-                    
-                    try:
-                        await applicant.send(f"❌ Unfortunately, your staff application for **{self.guild_obj.name}** has been denied.\n**Reason:** {reason_input.value}\n\nYou can reapply in the future.")
-                    except:
-                        pass
-                    
-                    if self.applicant_id in active_applications:
-                        del active_applications[self.applicant_id]
-                    
-                    for item in self.children:
-                        item.disabled = True
-                    await interaction.message.edit(view=self)
-                
-                modal.on_submit = modal_callback
-                await interaction.response.send_modal(modal)
-        
-        view = ApplicationButtons(ctx.author.id, ctx.guild)
-        await review_channel.send(embed=embed, view=view)
+        message = await outbox.send(review_channel, embed=embed, view=ApplicationReviewView(), priority=PRIORITY_ANNOUNCE)
+        await remember_view(message, "application", applicant_id=ctx.author.id)
         
     except discord.Forbidden:
         await ctx.send("❌ I couldn't DM you! Please enable DMs from server members and try again.", delete_after=10)
 
+# ----- GIVEAWAYS -----
+class GiveawayEntries:
+    """Entrant and winner id sets per giveaway, kept current from raw 🎉 reaction events."""
+
+    def __init__(self):
+        self.entrants = {}
+        self.winners = {}
+        self.ended = deque()
+        self.reconciling = {}
+
+    def load(self, message_ids):
+        for message_id in message_ids:
+            self.entrants[message_id] = store._read_giveaway_users('giveaway_entrants', message_id)
+            self.winners[message_id] = store._read_giveaway_users('giveaway_winners', message_id)
+
+    def start(self, message_id):
+        self.entrants[message_id] = set()
+        self.winners[message_id] = set()
+
+    def add(self, message_id, user_id):
+        self.entrants[message_id].add(user_id)
+        store.mark_entrant(message_id, user_id, True)
+
+    def remove(self, message_id, user_id):
+        self.entrants[message_id].discard(user_id)
+        store.mark_entrant(message_id, user_id, False)
+
+    def retire(self, message_id):
+        """Keep an ended giveaway in memory for rerolls, evicting the oldest beyond ENDED_GIVEAWAYS_KEPT."""
+        self.ended.append(message_id)
+        while len(self.ended) > ENDED_GIVEAWAYS_KEPT:
+            old = self.ended.popleft()
+            self.entrants.pop(old, None)
+            self.winners.pop(old, None)
+            self.reconciling.pop(old, None)
+
+    def reconcile(self, channel, message_id):
+        """Catch up (once per process) on 🎉 reactions added or removed while the bot was offline; returns the task."""
+        task = self.reconciling.get(message_id)
+        if task is None:
+            task = self.reconciling[message_id] = spawn(self._reconcile(channel, message_id))
+        return task
+
+    async def _reconcile(self, channel, message_id):
+        tracked = self.entrants.setdefault(message_id, set())
+        try:
+            message = await channel.fetch_message(message_id)
+            reaction = discord.utils.get(message.reactions, emoji="🎉")
+            if reaction is None or reaction.count - reaction.me == len(tracked):
+                return
+            
+            # Only drop ids tracked before the pass, so reactions arriving during it aren't undone.
+            before = set(tracked)
+            current = {user.id async for user in reaction.users() if not user.bot}
+        except discord.HTTPException as e:
+            print(f"Couldn't reconcile giveaway {message_id}: {e}")
+            return
+        
+        for user_id in current - tracked:
+            self.add(message_id, user_id)
+        for user_id in before - current:
+            self.remove(message_id, user_id)
+        print(f"Reconciled giveaway {message_id}: +{len(current - before)} / -{len(before - current)} entrants")
+
+    async def ensure_loaded(self, message):
+        """Bring a giveaway's entrants into memory; return False if the message isn't a giveaway.
+
+        Falls back to one pass over the 🎉 reactors for giveaways that predate
+        entrant tracking.
+        """
+        if message.id in self.entrants:
+            return True
+        
+        entrants = await store.read_giveaway_users('giveaway_entrants', message.id)
+        if not entrants:
+            reaction = discord.utils.get(message.reactions, emoji="🎉")
+            if not reaction:
+                return False
+            entrants = {user.id async for user in reaction.users() if not user.bot}
+            for user_id in entrants:
+                store.mark_entrant(message.id, user_id, True)
+        
+        self.entrants[message.id] = entrants
+        self.winners[message.id] = await store.read_giveaway_users('giveaway_winners', message.id)
+        self.retire(message.id)
+        return True
+
+    async def draw(self, message_id, count):
+        """Pick up to count entrants who haven't already won this giveaway."""
+        winners = self.winners.setdefault(message_id, set())
+        pool = [user_id for user_id in self.entrants.get(message_id, ()) if user_id not in winners]
+        picked = random.sample(pool, min(count, len(pool)))
+        winners.update(picked)
+        if picked:
+            await store.save_giveaway_winners(message_id, picked)
+        return picked
+
+giveaway_entries = GiveawayEntries()
+
+def winner_mentions(user_ids):
+    return ", ".join(f"<@{user_id}>" for user_id in user_ids)
+
+async def forget_giveaway(message_id):
+    """Stop tracking a giveaway and return its data, or None if it wasn't active."""
+    data = active_giveaways.pop(message_id, None)
+    giveaway_timers.cancel(message_id)
+    if data is not None:
+        giveaway_entries.retire(message_id)
+        await store.delete_giveaway(message_id)
+    return data
+
+async def end_giveaway(message_id):
+    """Draw and announce the winners once a giveaway's end_time has passed."""
+    data = active_giveaways.get(message_id)
+    if data is None:
+        return
+    
+    # Resolve the channel before touching persisted state, so a failed lookup can be retried.
+    channel = bot.get_channel(data['channel_id'])
+    if channel is None:
+        try:
+            channel = await bot.fetch_channel(data['channel_id'])
+        except (discord.NotFound, discord.Forbidden):
+            print(f"Giveaway {message_id}: channel {data['channel_id']} is gone, dropping it")
+            await forget_giveaway(message_id)
+            return
+        except discord.HTTPException as e:
+            print(f"Giveaway {message_id}: couldn't fetch channel ({e}), retrying in a minute")
+            giveaway_timers.schedule(message_id, time.time() + 60)
+            return
+    
+    await giveaway_entries.reconcile(channel, message_id)
+    # The giveaway stays persisted until the announcement is out; a retry (or a
+    # restart) re-announces the winners already drawn instead of drawing again.
+    winners = giveaway_entries.winners.get(message_id) or await giveaway_entries.draw(message_id, data['winner_count'])
+    try:
+        if not winners:
+            await outbox.send(channel, f"🎉 Giveaway for **{data['prize']}** ended with no valid entries.", priority=PRIORITY_ANNOUNCE)
+        else:
+            label = "Winner" if len(winners) == 1 else "Winners"
+            await outbox.send(
+                channel,
+                f"🎉 Giveaway ended! {label}: {winner_mentions(winners)} won **{data['prize']}**!",
+                reference=discord.MessageReference(message_id=message_id, channel_id=channel.id, fail_if_not_exists=False),
+                priority=PRIORITY_ANNOUNCE
+            )
+    except discord.HTTPException as e:
+        print(f"Giveaway {message_id}: couldn't announce the result ({e}), retrying in a minute")
+        giveaway_timers.schedule(message_id, time.time() + 60)
+        return
+    
+    await forget_giveaway(message_id)
+
+giveaway_timers = DeadlineScheduler("giveaway", end_giveaway)
+active_giveaways = store.load_giveaways()
+giveaway_entries.load(active_giveaways)
+for giveaway_id, giveaway_data in active_giveaways.items():
+    giveaway_timers.schedule(giveaway_id, giveaway_data['end_time'])
+
 @bot.hybrid_command()
 async def giveaway(ctx):
     staff_role = ctx.guild.get_role(STAFF_ROLE_ID)
@@ -1175,8 +2968,10 @@ async def giveaway(ctx):
     modal = Modal(title="Create Giveaway")
     prize_input = TextInput(label="Prize", placeholder="Enter the prize")
     duration_input = TextInput(label="Duration (minutes)", placeholder="Enter duration in minutes")
+    winners_input = TextInput(label="Winners", placeholder="How many winners? (default 1)", required=False)
     modal.add_item(prize_input)
     modal.add_item(duration_input)
+    modal.add_item(winners_input)
 
     async def modal_callback(modal_interaction):
         try:
@@ -1185,30 +2980,39 @@ async def giveaway(ctx):
             await modal_interaction.response.send_message("❌ Invalid duration!", ephemeral=True)
             return
         
+        try:
+            winner_count = int(winners_input.value) if winners_input.value else 1
+        except ValueError:
+            winner_count = 0
+        if winner_count < 1:
+            await modal_interaction.response.send_message("❌ Invalid number of winners!", ephemeral=True)
+            return
+        
         embed = discord.Embed(
             title="🎉 GIVEAWAY 🎉",
-            description=f"**Prize:** {prize_input.value}\n**Duration:** {duration} minutes\n**Hosted by:** {ctx.author.mention}\n\nReact with 🎉 to enter!",
+            description=f"**Prize:** {prize_input.value}\n**Winners:** {winner_count}\n**Duration:** {duration} minutes\n**Hosted by:** {ctx.author.mention}\n\nReact with 🎉 to enter!",
             color=discord.Color.gold()
         )
         
-        try:
-            file = discord.File("giveaway.png", filename="giveaway.png")
-            embed.set_image(url="attachment://giveaway.png")
-            message = await ctx.channel.send(content="@everyone", embed=embed, file=file)
-        except FileNotFoundError:
-            message = await ctx.channel.send(content="@everyone", embed=embed)
-        
-        await message.add_reaction("🎉")
+        # The queued announcement can wait on the channel's rate limit past the 3s interaction deadline.
+        await modal_interaction.response.defer(ephemeral=True)
+        message = await session_assets.send(outbox.sender(ctx.channel, PRIORITY_ANNOUNCE), "giveaway.png", embed, content="@everyone")
         
+        # Register before the first await so early 🎉 reactions are counted.
+        giveaway_entries.start(message.id)
         active_giveaways[message.id] = {
             'prize': prize_input.value,
             'duration': duration,
             'host': ctx.author.id,
             'end_time': modal_interaction.created_at.timestamp() + (duration * 60),
-            'channel_id': ctx.channel.id
+            'channel_id': ctx.channel.id,
+            'winner_count': winner_count
         }
+        giveaway_timers.schedule(message.id, active_giveaways[message.id]['end_time'])
+        await store.save_giveaway(message.id, active_giveaways[message.id])
+        await message.add_reaction("🎉")
         
-        await modal_interaction.response.send_message(f"✓ Giveaway started! It will end in {duration} minutes.", ephemeral=True)
+        await modal_interaction.followup.send(f"✓ Giveaway started! It will end in {duration} minutes.", ephemeral=True)
 
     modal.on_submit = modal_callback
     
@@ -1228,31 +3032,39 @@ async def giveaway(ctx):
         await ctx.message.delete()
         await ctx.send("Click to create a giveaway:", view=view, ephemeral=True)
 
-@bot.command()
-async def reroll(ctx, message_id: int):
-    staff_role = ctx.guild.get_role(STAFF_ROLE_ID)
-    if staff_role not in ctx.author.roles:
-        await ctx.send("❌ You don't have permission to reroll giveaways.")
-        return
+async def load_giveaway_for(ctx, message_id):
+    """Make sure a giveaway's entrants are in memory, replying with the problem and returning False if not."""
+    if message_id in giveaway_entries.entrants:
+        return True
     
     try:
         message = await ctx.channel.fetch_message(message_id)
     except:
         await ctx.send("❌ Message not found!")
-        return
+        return False
     
-    reaction = discord.utils.get(message.reactions, emoji="🎉")
-    if not reaction:
+    if not await giveaway_entries.ensure_loaded(message):
         await ctx.send("❌ No giveaway found on that message!")
+        return False
+    return True
+
+@bot.command()
+async def reroll(ctx, message_id: int, count: int = 1):
+    staff_role = ctx.guild.get_role(STAFF_ROLE_ID)
+    if staff_role not in ctx.author.roles:
+        await ctx.send("❌ You don't have permission to reroll giveaways.")
+        return
+    
+    if not await load_giveaway_for(ctx, message_id):
         return
     
-    users = [user async for user in reaction.users() if not user.bot]
-    if not users:
+    winners = await giveaway_entries.draw(message_id, max(count, 1))
+    if not winners:
         await ctx.send("❌ No valid entries!")
         return
     
-    winner = random.choice(users)
-    await ctx.send(f"🎉 New winner: {winner.mention}!")
+    label = "New winner" if len(winners) == 1 else "New winners"
+    await ctx.send(f"🎉 {label}: {winner_mentions(winners)}!")
 
 @bot.command()
 async def endgiveaway(ctx, message_id: int):
@@ -1261,31 +3073,20 @@ async def endgiveaway(ctx, message_id: int):
         await ctx.send("❌ You don't have permission to end giveaways.")
         return
     
-    try:
-        message = await ctx.channel.fetch_message(message_id)
-    except:
-        await ctx.send("❌ Message not found!")
-        return
-    
-    reaction = discord.utils.get(message.reactions, emoji="🎉")
-    if not reaction:
-        await ctx.send("❌ No giveaway found on that message!")
+    if not await load_giveaway_for(ctx, message_id):
         return
     
-    users = [user async for user in reaction.users() if not user.bot]
-    if not users:
+    data = active_giveaways.get(message_id)
+    winners = await giveaway_entries.draw(message_id, data['winner_count'] if data else 1)
+    if not winners:
         await ctx.send("❌ No valid entries!")
         return
     
-    winner = random.choice(users)
+    await forget_giveaway(message_id)
+    prize = data['prize'] if data else "Prize"
     
-    if message_id in active_giveaways:
-        prize = active_giveaways[message_id]['prize']
-        del active_giveaways[message_id]
-    else:
-        prize = "Prize"
-    
-    await ctx.send(f"🎉 Giveaway ended! Winner: {winner.mention} won **{prize}**!")
+    label = "Winner" if len(winners) == 1 else "Winners"
+    await ctx.send(f"🎉 Giveaway ended! {label}: {winner_mentions(winners)} won **{prize}**!")
 
 @bot.command()
 async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided"):
@@ -1310,15 +3111,13 @@ async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided
     user_warnings[member.id] = warning_count
     
     if warning_count == 1:
-        await member.add_roles(role1)
+        await role_mutator.change(member, add=[role1], reason=reason)
         await ctx.send(f"⚠️ {member.mention} has been warned! (Warning 1/3)\nReason: {reason}")
     elif warning_count == 2:
-        await member.remove_roles(role1)
-        await member.add_roles(role2)
+        await role_mutator.change(member, add=[role2], remove=[role1], reason=reason)
         await ctx.send(f"⚠️ {member.mention} has been warned! (Warning 2/3)\nReason: {reason}")
     elif warning_count >= 3:
-        await member.remove_roles(role1, role2)
-        await member.add_roles(role3)
+        await role_mutator.change(member, add=[role3], remove=[role1, role2], reason=reason)
         await ctx.send(f"⚠️ {member.mention} has been warned! (Warning 3/3 - FINAL WARNING)\nReason: {reason}")
         
         alarm_channel = ctx.guild.get_channel(WARNING_STAFF_CHANNEL)
@@ -1329,7 +3128,7 @@ async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided
                 color=discord.Color.red(),
                 timestamp=ctx.message.created_at
             )
-            await alarm_channel.send(f"@everyone", embed=alarm_embed)
+            outbox.post(alarm_channel, f"@everyone", embed=alarm_embed, priority=PRIORITY_ANNOUNCE)
     
     warning_channel = ctx.guild.get_channel(WARNING_STAFF_CHANNEL)
     if warning_channel:
@@ -1339,23 +3138,22 @@ async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided
             color=discord.Color.orange(),
             timestamp=ctx.message.created_at
         )
-        await warning_channel.send(embed=embed)
+        staff_log.post(warning_channel, embed=embed)
 
 @bot.command()
 async def rank(ctx, member: discord.Member = None):
     if not member:
         member = ctx.author
     
-    if member.id not in user_levels:
-        user_levels[member.id] = {'xp': 0, 'level': 1}
-    
-    level = user_levels[member.id]['level']
-    xp = user_levels[member.id]['xp']
+    profile = get_profile(member.id)
+    level = profile.level
+    xp = profile.xp
     xp_needed = level * 100
     
     embed = discord.Embed(title=f"{member.display_name}'s Rank", color=discord.Color.blue())
     embed.add_field(name="Level", value=level, inline=True)
     embed.add_field(name="XP", value=f"{xp}/{xp_needed}", inline=True)
+    embed.add_field(name="Rank", value=f"#{level_index.rank_of(member.id)}", inline=True)
     embed.set_thumbnail(url=member.display_avatar.url)
     
     await ctx.send(embed=embed)
@@ -1365,11 +3163,9 @@ async def balance(ctx, member: discord.Member = None):
     if not member:
         member = ctx.author
     
-    if member.id not in user_economy:
-        user_economy[member.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
-    
-    wallet = user_economy[member.id]['wallet']
-    bank = user_economy[member.id]['bank']
+    profile = get_profile(member.id)
+    wallet = profile.wallet
+    bank = profile.bank
     
     embed = discord.Embed(title=f"💰 {member.display_name}'s Balance", color=discord.Color.green())
     embed.add_field(name="Wallet", value=f"${wallet}", inline=True)
@@ -1380,43 +3176,41 @@ async def balance(ctx, member: discord.Member = None):
 
 @bot.command()
 async def daily(ctx):
-    if ctx.author.id not in user_economy:
-        user_economy[ctx.author.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
-    
-    last_daily = user_economy[ctx.author.id]['last_daily']
-    now = datetime.now()
+    profile = get_profile(ctx.author.id)
+    now = int(time.time())
     
-    if last_daily:
-        time_diff = (now - last_daily).total_seconds()
+    if profile.last_daily:
+        time_diff = now - profile.last_daily
         if time_diff < 86400:
             hours_left = int((86400 - time_diff) / 3600)
             await ctx.send(f"❌ You already claimed your daily reward! Come back in {hours_left} hours.")
             return
     
     reward = random.randint(100, 500)
-    user_economy[ctx.author.id]['wallet'] += reward
-    user_economy[ctx.author.id]['last_daily'] = now
+    profile.wallet += reward
+    profile.last_daily = now
+    store.mark_economy(ctx.author.id)
+    wealth_index.mark(ctx.author.id)
     
     await ctx.send(f"💰 You claimed your daily reward of ${reward}!")
 
 @bot.command()
 async def work(ctx):
-    if ctx.author.id not in user_economy:
-        user_economy[ctx.author.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
+    profile = get_profile(ctx.author.id)
+    now = int(time.time())
     
-    last_work = user_economy[ctx.author.id]['last_work']
-    now = datetime.now()
-    
-    if last_work:
-        time_diff = (now - last_work).total_seconds()
+    if profile.last_work:
+        time_diff = now - profile.last_work
         if time_diff < 3600:
             minutes_left = int((3600 - time_diff) / 60)
             await ctx.send(f"❌ You're tired! Rest for {minutes_left} more minutes.")
             return
     
     reward = random.randint(50, 200)
-    user_economy[ctx.author.id]['wallet'] += reward
-    user_economy[ctx.author.id]['last_work'] = now
+    profile.wallet += reward
+    profile.last_work = now
+    store.mark_economy(ctx.author.id)
+    wealth_index.mark(ctx.author.id)
     
     jobs = ["delivery driver", "cashier", "waiter", "mechanic", "taxi driver"]
     job = random.choice(jobs)
@@ -1425,11 +3219,10 @@ async def work(ctx):
 
 @bot.command()
 async def deposit(ctx, amount: str):
-    if ctx.author.id not in user_economy:
-        user_economy[ctx.author.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
+    profile = get_profile(ctx.author.id)
     
     if amount.lower() == "all":
-        amount = user_economy[ctx.author.id]['wallet']
+        amount = profile.wallet
     else:
         try:
             amount = int(amount)
@@ -1437,22 +3230,22 @@ async def deposit(ctx, amount: str):
             await ctx.send("❌ Invalid amount!")
             return
     
-    if amount > user_economy[ctx.author.id]['wallet']:
+    if amount > profile.wallet:
         await ctx.send("❌ You don't have that much money in your wallet!")
         return
     
-    user_economy[ctx.author.id]['wallet'] -= amount
-    user_economy[ctx.author.id]['bank'] += amount
+    profile.wallet -= amount
+    profile.bank += amount
+    store.mark_economy(ctx.author.id)
     
     await ctx.send(f"✓ Deposited ${amount} to your bank!")
 
 @bot.command()
 async def withdraw(ctx, amount: str):
-    if ctx.author.id not in user_economy:
-        user_economy[ctx.author.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
+    profile = get_profile(ctx.author.id)
     
     if amount.lower() == "all":
-        amount = user_economy[ctx.author.id]['bank']
+        amount = profile.bank
     else:
         try:
             amount = int(amount)
@@ -1460,58 +3253,68 @@ async def withdraw(ctx, amount: str):
             await ctx.send("❌ Invalid amount!")
             return
     
-    if amount > user_economy[ctx.author.id]['bank']:
+    if amount > profile.bank:
         await ctx.send("❌ You don't have that much money in your bank!")
         return
     
-    user_economy[ctx.author.id]['bank'] -= amount
-    user_economy[ctx.author.id]['wallet'] += amount
+    profile.bank -= amount
+    profile.wallet += amount
+    store.mark_economy(ctx.author.id)
     
     await ctx.send(f"✓ Withdrew ${amount} from your bank!")
 
 @bot.command()
 async def give(ctx, member: discord.Member, amount: int):
-    if ctx.author.id not in user_economy:
-        user_economy[ctx.author.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
-    
-    if member.id not in user_economy:
-        user_economy[member.id] = {'wallet': 0, 'bank': 0, 'last_daily': None, 'last_work': None}
+    giver = get_profile(ctx.author.id)
+    receiver = get_profile(member.id)
     
-    if amount > user_economy[ctx.author.id]['wallet']:
+    if amount > giver.wallet:
         await ctx.send("❌ You don't have that much money!")
         return
     
-    user_economy[ctx.author.id]['wallet'] -= amount
-    user_economy[member.id]['wallet'] += amount
+    giver.wallet -= amount
+    receiver.wallet += amount
+    store.mark_economy(ctx.author.id)
+    store.mark_economy(member.id)
+    wealth_index.mark(ctx.author.id)
+    wealth_index.mark(member.id)
     
     await ctx.send(f"✓ You gave ${amount} to {member.mention}!")
 
 @bot.command()
 async def leaderboard(ctx, category: str = "levels"):
     if category.lower() == "levels":
-        sorted_users = sorted(user_levels.items(), key=lambda x: (x[1]['level'], x[1]['xp']), reverse=True)
         embed = discord.Embed(title="📊 Level Leaderboard", color=discord.Color.blue())
         
-        for i, (user_id, data) in enumerate(sorted_users[:10], 1):
-            user = await bot.fetch_user(user_id)
+        top = level_index.top(10)
+        names = await name_cache.resolve(ctx.guild, [user_id for user_id, data in top])
+        for i, (user_id, data) in enumerate(top, 1):
             embed.add_field(
-                name=f"{i}. {user.name}",
-                value=f"Level {data['level']} ({data['xp']} XP)",
+                name=f"{i}. {names[user_id]}",
+                value=f"Level {data.level} ({data.xp} XP)",
                 inline=False
             )
+        
+        position = level_index.rank_of(ctx.author.id)
+        if position:
+            embed.set_footer(text=f"Your rank: #{position}")
     
     elif category.lower() == "economy":
-        sorted_users = sorted(user_economy.items(), key=lambda x: (x[1]['wallet'] + x[1]['bank']), reverse=True)
         embed = discord.Embed(title="💰 Economy Leaderboard", color=discord.Color.green())
         
-        for i, (user_id, data) in enumerate(sorted_users[:10], 1):
-            user = await bot.fetch_user(user_id)
-            total = data['wallet'] + data['bank']
+        top = wealth_index.top(10)
+        names = await name_cache.resolve(ctx.guild, [user_id for user_id, data in top])
+        for i, (user_id, data) in enumerate(top, 1):
+            total = data.wallet + data.bank
             embed.add_field(
-                name=f"{i}. {user.name}",
+                name=f"{i}. {names[user_id]}",
                 value=f"${total}",
                 inline=False
             )
+        
+        position = wealth_index.rank_of(ctx.author.id)
+        if position:
+            embed.set_footer(text=f"Your rank: #{position}")
     
     await ctx.send(embed=embed)
 
@@ -1610,7 +3413,7 @@ async def suggest(ctx, *, suggestion: str):
         )
         embed.set_footer(text=f"Suggested by {ctx.author.name}")
         
-        message = await channel.send(embed=embed)
+        message = await outbox.send(channel, embed=embed, priority=PRIORITY_ANNOUNCE)
         await message.add_reaction("👍")
         await message.add_reaction("👎")
         
@@ -1702,10 +3505,57 @@ async def reactionrole(ctx, message_id: int, emoji: str, role: discord.Role):
         return
     
     await message.add_reaction(emoji)
-    reaction_roles[(message_id, emoji)] = role.id
+    await add_reaction_role(message_id, emoji, role.id)
     
     await ctx.send(f"✓ Reaction role setup! React with {emoji} to get {role.mention}", delete_after=5)
 
+def slowest(histograms, count=5):
+    ranked = sorted(histograms.items(), key=lambda item: item[1].sum, reverse=True)[:count]
+    lines = [f"`{name}` {h.count}× avg {h.sum / h.count * 1000:.1f}ms max {h.max * 1000:.0f}ms" for name, h in ranked]
+    return "\n".join(lines) or "No data yet"
+
+@bot.command()
+async def perf(ctx):
+    """Show loop lag, the most expensive handlers and commands, and the last loop stall"""
+    staff_role = ctx.guild.get_role(STAFF_ROLE_ID)
+    if staff_role not in ctx.author.roles:
+        await ctx.send("❌ You don't have permission to view performance data.")
+        return
+    
+    embed = discord.Embed(title="📈 Bot Performance", color=discord.Color.blue())
+    latency = "n/a" if math.isnan(bot.latency) else f"{bot.latency * 1000:.0f}ms"
+    embed.add_field(name="Gateway Latency", value=latency, inline=True)
+    embed.add_field(
+        name="Loop Lag",
+        value=f"now {loop_lag.current * 1000:.1f}ms\np99 {loop_lag.percentile(0.99) * 1000:.1f}ms\nmax {loop_lag.max * 1000:.1f}ms",
+        inline=True
+    )
+    embed.add_field(
+        name="Queues",
+        value=f"outbound {outbox.depth()}\nreaction roles {len(reaction_role_queue.order)}\nbackground {len(background_tasks)}",
+        inline=True
+    )
+    embed.add_field(
+        name="Avatar Cache",
+        value=f"{len(avatar_cache.entries)} tiles, {avatar_cache.size / 1024 / 1024:.1f}MiB\n{avatar_cache.hits} hits / {avatar_cache.misses} misses",
+        inline=True
+    )
+    embed.add_field(name="Event Handlers (by total time)", value=slowest(bot_metrics.handler_latency), inline=False)
+    embed.add_field(name="Commands (by total time)", value=slowest(bot_metrics.command_latency), inline=False)
+    
+    if loop_watchdog.reports:
+        report = loop_watchdog.reports[-1]
+        stack = "\n".join(report['stack'].strip().splitlines()[-6:])[-900:]
+        embed.add_field(
+            name=f"Last Loop Stall ({report['seconds']:.2f}s, {loop_watchdog.stalls} total)",
+            value=f"<t:{int(report['at'].timestamp())}:R>\n```{stack}```",
+            inline=False
+        )
+    else:
+        embed.add_field(name="Loop Stalls", value=f"None over {SLOW_CALLBACK_SECONDS * 1000:.0f}ms", inline=False)
+    
+    await ctx.send(embed=embed)
+
 @bot.command()
 async def help(ctx, category: str = None):
     if not category:
@@ -1750,6 +3600,7 @@ async def help(ctx, category: str = None):
         embed.add_field(name="?ban @user <reason>", value="Ban a member", inline=False)
         embed.add_field(name="?clear [amount]", value="Delete messages", inline=False)
         embed.add_field(name="?reactionrole <msg_id> <emoji> @role", value="Setup reaction roles", inline=False)
+        embed.add_field(name="?perf", value="Show bot latency and slow handlers", inline=False)
         embed.set_footer(text="Staff only commands")
         await ctx.send(embed=embed)
     
@@ -1789,10 +3640,15 @@ async def help(ctx, category: str = None):
     else:
         await ctx.send("❌ Invalid category! Use: `leveling`, `economy`, `moderation`, `fun`, `utility`, `server`")
 
-if not TOKEN:
-    print("Error: No bot token found. Please add DISCORD_BOT_TOKEN to Secrets.")
-else:
-    bot.run(TOKEN)
+if __name__ == "__main__":
+    if not TOKEN:
+        print("Error: No bot token found. Please add DISCORD_BOT_TOKEN to Secrets.")
+    else:
+        try:
+            bot.run(TOKEN)
+        finally:
+            card_renderer.close()
+            store.close()
 
 
 